@@ -0,0 +1,82 @@
+"""Compares AdjSenSplitter.split, one page at a time on the event loop, with
+split_many, which pipes every page through spaCy in worker processes.
+
+Reports pages/sec for each path and how many pages get exactly the same
+chunks as with split (oversized clusters are re-clustered from the existing
+vectors by split_many rather than re-parsed, so a few may differ).
+
+Run from src/orchestrator (inside the orchestrator container):
+    python -m benchmarks.bench_adjsen_splitter --corpus /path/to/texts --workers 4
+Without --corpus a synthetic corpus is generated.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import random
+import time
+
+from retrieval.splitter import AdjSenSplitter
+
+
+def load_corpus(path: str | None, pages: int) -> list[str]:
+    if path is not None:
+        files = sorted(Path(path).glob("**/*.txt"))
+        return [f.read_text(encoding="utf-8", errors="replace") for f in files]
+
+    rng = random.Random(0)
+    words = (
+        "the model retrieves relevant documents from the web and splits them "
+        "into chunks that are embedded and ranked against the user question"
+    ).split()
+
+    def sentence() -> str:
+        return " ".join(rng.choices(words, k=rng.randint(6, 25))).capitalize() + "."
+
+    return [
+        " ".join(sentence() for _ in range(rng.randint(20, 200))) for _ in range(pages)
+    ]
+
+
+async def run(args) -> None:
+    corpus = load_corpus(args.corpus, args.pages)
+    if not corpus:
+        raise SystemExit("The corpus is empty")
+    print(f"{len(corpus)} pages, {sum(map(len, corpus)) / 1e6:.1f} M chars")
+
+    splitter = AdjSenSplitter(model=args.model, workers=0)
+    start = time.perf_counter()
+    reference = [await splitter.split(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    print(f"{'path':>22} {'pages/s':>9} {'same':>7}")
+    print(f"{'split':>22} {len(corpus) / elapsed:>9.1f} {1:>7.1%}")
+
+    for workers in sorted({0, args.workers}):
+        splitter = AdjSenSplitter(
+            model=args.model, workers=workers, batch_size=args.batch_size
+        )
+        await splitter.warmup()
+        try:
+            start = time.perf_counter()
+            chunks = await splitter.split_many(corpus)
+            elapsed = time.perf_counter() - start
+        finally:
+            await splitter.shutdown()
+
+        same = sum(a == b for a, b in zip(chunks, reference)) / len(corpus)
+        label = f"split_many workers={workers}"
+        print(f"{label:>22} {len(corpus) / elapsed:>9.1f} {same:>7.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help="directory of extracted page .txt files")
+    parser.add_argument("--pages", type=int, default=50, help="synthetic pages")
+    parser.add_argument("--model", default="en_core_web_sm")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Measures event-loop latency while concurrent queries hit the vector cache,
+comparing the blocking redis client the cache used to call with the
+redis.asyncio backend of RedisVectorCache.
+
+Needs a local redis-stack. Run from src/orchestrator:
+    python -m benchmarks.bench_cache_event_loop --host localhost --concurrency 1 8 32 128
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import numpy as np
+import redis
+
+from retrieval.cache import INDEX_NAME, RedisVectorCache
+
+
+class BlockingCache:
+    """KNN search through the synchronous client, as find_similar used to do."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.client = redis.Redis(host=host, port=port)
+
+    async def find_similar(self, vector, k=10):
+        return (
+            self.client.ft(INDEX_NAME)
+            .search(
+                RedisVectorCache._knn_query(k),
+                {"query_vector": np.array(vector, dtype=np.float32).tobytes()},
+            )
+            .docs
+        )
+
+
+async def monitor_lag(samples: list[float], stop: asyncio.Event, interval: float):
+    """Records how late the loop wakes up a task that asked to sleep `interval`."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_level(cache, concurrency: int, queries: int, dimension: int, k: int):
+    rng = np.random.default_rng(concurrency)
+    vectors = rng.standard_normal((concurrency, dimension)).tolist()
+    lag: list[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lag, stop, interval=0.005))
+
+    async def client(vector):
+        for _ in range(queries):
+            await cache.find_similar(vector, k)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(vector) for vector in vectors))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    lag = lag or [0.0]
+    return {
+        "qps": concurrency * queries / elapsed,
+        "lag_p50": statistics.median(lag) * 1000,
+        "lag_p99": float(np.percentile(lag, 99)) * 1000,
+        "lag_max": max(lag) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--queries", type=int, default=20, help="queries per client")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    async_cache = RedisVectorCache(
+        host=args.host, port=args.port, vector_dimension=args.dimension
+    )
+    await async_cache.warmup()
+    backends = {"blocking": BlockingCache(args.host, args.port), "asyncio": async_cache}
+
+    print(
+        f"{'backend':>9} {'clients':>8} {'qps':>9}"
+        f" {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}"
+    )
+    for concurrency in args.concurrency:
+        for name, cache in backends.items():
+            r = await run_level(
+                cache, concurrency, args.queries, args.dimension, args.k
+            )
+            print(
+                f"{name:>9} {concurrency:>8} {r['qps']:>9.1f}"
+                f" {r['lag_p50']:>11.2f} {r['lag_p99']:>11.2f} {r['lag_max']:>11.2f}"
+            )
+
+    await async_cache.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Compares the NumPy top-k scoring path of Retriever.get_most_similar against
+the previous pandas/sklearn implementation.
+
+Run from src/orchestrator (inside the orchestrator container):
+    python -m benchmarks.bench_get_most_similar --chunks 100 500 1000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+
+from models.document import Document
+from retrieval import Retriever
+
+
+def legacy_get_most_similar(query_vector, data, k=5) -> list[Document]:
+    """Previous implementation, kept here as the baseline."""
+
+    query_vector = np.array(query_vector).reshape(1, -1)
+
+    def compute_cosine_similarity(row):
+        return cosine_similarity(query_vector, row)[0][0]
+
+    df: Any = pd.DataFrame(data)
+    df["vector"] = df["vector"].apply(lambda x: np.array(x).reshape(1, -1))
+    df["similarity"] = df["vector"].apply(compute_cosine_similarity)
+    similar = df.nlargest(k, "similarity")[["text", "url", "vector", "similarity"]]
+    similar["vector"] = similar["vector"].apply(lambda x: x[0].tolist())
+
+    return [Document(**json_doc) for json_doc in similar.to_dict("records")]
+
+
+def make_data(chunks: int, dimension: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, dimension))
+    data = [
+        {"text": f"chunk {i}", "url": f"https://example.com/{i % 10}", "vector": v}
+        for i, v in enumerate(vectors.tolist())
+    ]
+    return rng.standard_normal(dimension).tolist(), data
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    retriever = Retriever(None, None, None, None, None)  # type: ignore
+    loop = asyncio.new_event_loop()
+
+    print(f"{'chunks':>8} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8}  same")
+    for chunks in args.chunks:
+        query_vector, data = make_data(chunks, args.dimension, seed=chunks)
+
+        def run_new():
+            return loop.run_until_complete(
+                retriever.get_most_similar(query_vector, data, args.k)
+            )
+
+        legacy = legacy_get_most_similar(query_vector, data, args.k)
+        new = run_new()
+        same = [d.text for d in legacy] == [d.text for d in new] and np.allclose(
+            [d.similarity for d in legacy], [d.similarity for d in new], atol=1e-5
+        )
+
+        legacy_time = timed(
+            lambda: legacy_get_most_similar(query_vector, data, args.k), args.repeat
+        )
+        new_time = timed(run_new, args.repeat)
+        print(
+            f"{chunks:>8} {legacy_time * 1000:>10.2f} {new_time * 1000:>10.2f}"
+            f" {legacy_time / new_time:>7.1f}x  {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compares HTML text extraction backends on a corpus of saved pages.
+
+Throughput is measured inline on the event loop and through the HtmlParser
+process pool. Output of every backend is compared against html.parser, the
+previous extraction, as the exact-match rate and the mean token Jaccard.
+
+Run from src/orchestrator (inside the orchestrator container):
+    python -m benchmarks.bench_html_parsing --corpus /path/to/pages --workers 4
+Without --corpus a synthetic corpus is generated.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import time
+
+from retrieval.parsing import HtmlParser
+from util.html import PARSER_BACKENDS, extract_text
+
+
+def load_corpus(path: str | None, pages: int) -> list[str]:
+    if path is None:
+        paragraph = "<p>Lorem <b>ipsum</b> dolor sit amet, consectetur adipiscing.</p>"
+        return [
+            "<html><head><title>Page</title><script>var x = 1;</script></head>"
+            f"<body><nav>Home | About</nav><div>{paragraph * (50 + i % 200)}</div>"
+            "</body></html>"
+            for i in range(pages)
+        ]
+    files = sorted(Path(path).glob("**/*.htm*"))
+    return [f.read_text(encoding="utf-8", errors="replace") for f in files]
+
+
+def jaccard(a: str, b: str) -> float:
+    a_tokens, b_tokens = set(a.split()), set(b.split())
+    if not a_tokens and not b_tokens:
+        return 1.0
+    return len(a_tokens & b_tokens) / len(a_tokens | b_tokens)
+
+
+async def pooled_throughput(backend: str, corpus: list[str], workers: int) -> float:
+    parser = HtmlParser(backend=backend, workers=workers, inline_below=0)
+    await parser.warmup()
+    try:
+        # The first round pays for worker start-up and imports.
+        await asyncio.gather(*(parser.parse(body) for body in corpus[:workers]))
+        start = time.perf_counter()
+        await asyncio.gather(*(parser.parse(body) for body in corpus))
+        return len(corpus) / (time.perf_counter() - start)
+    finally:
+        await parser.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help="directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic pages")
+    parser.add_argument("--backends", nargs="+", default=list(PARSER_BACKENDS))
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.pages)
+    if not corpus:
+        raise SystemExit("The corpus is empty")
+    megabytes = sum(len(body) for body in corpus) / 1e6
+    print(f"{len(corpus)} pages, {megabytes:.1f} MB")
+
+    reference = [extract_text(body, "html.parser") for body in corpus]
+    print(
+        f"{'backend':>12} {'inline p/s':>11} {'pooled p/s':>11}"
+        f" {'exact':>7} {'jaccard':>8}"
+    )
+    for backend in args.backends:
+        try:
+            extract_text("<p></p>", backend)
+        except ImportError as e:
+            print(f"{backend:>12} unavailable: {e}")
+            continue
+
+        start = time.perf_counter()
+        texts = [extract_text(body, backend) for body in corpus]
+        inline = len(corpus) / (time.perf_counter() - start)
+        pooled = asyncio.run(pooled_throughput(backend, corpus, args.workers))
+
+        exact = sum(t == r for t, r in zip(texts, reference)) / len(corpus)
+        similarity = sum(jaccard(t, r) for t, r in zip(texts, reference)) / len(corpus)
+        print(
+            f"{backend:>12} {inline:>11.1f} {pooled:>11.1f}"
+            f" {exact:>7.1%} {similarity:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
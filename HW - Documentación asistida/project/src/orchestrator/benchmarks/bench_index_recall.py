@@ -0,0 +1,148 @@
+"""Compares recall@k and query latency of FLAT and HNSW chunk indexes, for
+either JSON or hash (packed vector) chunk storage, with FLOAT32 or FLOAT16
+vectors.
+
+Seeds a synthetic corpus under a throwaway key prefix of a local redis-stack,
+builds one FLAT index (ground truth) and one HNSW index per configuration over
+it, then removes everything it created. Run from src/orchestrator:
+    python -m benchmarks.bench_index_recall --chunks 20000 --hnsw 16,200,10 16,200,50 32,400,100
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+from retrieval.cache import RedisVectorCache, VectorIndexConfig
+
+PREFIX = "bench:chunks:"
+
+
+def make_corpus(chunks: int, dimension: int, seed: int = 0):
+    """Clustered vectors, closer to real embeddings than uniform noise."""
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(chunks // 50, 1), dimension))
+    labels = rng.integers(len(centers), size=chunks)
+    corpus = centers[labels] + 0.3 * rng.standard_normal((chunks, dimension))
+    return corpus.astype(np.float32)
+
+
+async def seed(cache: RedisVectorCache, corpus: np.ndarray, batch: int = 500):
+    for start in range(0, len(corpus), batch):
+        pipeline = cache.client.pipeline(transaction=False)
+        for i in range(start, min(start + batch, len(corpus))):
+            cache._set_chunk(
+                pipeline,
+                f"{PREFIX}{i}",
+                {"text": f"chunk {i}", "url": "bench", "vector": corpus[i].tolist()},
+            )
+        await pipeline.execute()
+
+
+async def wait_indexed(cache: RedisVectorCache, index_name: str):
+    while True:
+        info = await cache.client.ft(index_name).info()
+        if float(info["percent_indexed"]) >= 1 and not int(info["indexing"]):
+            return
+        await asyncio.sleep(0.5)
+
+
+async def run_queries(cache, index_name, queries, k):
+    latencies, ids = [], []
+    query = RedisVectorCache._knn_query(k)
+    for vector in queries:
+        start = time.perf_counter()
+        result = await cache.client.ft(index_name).search(
+            query, {"query_vector": cache._vector_bytes(vector)}
+        )
+        latencies.append(time.perf_counter() - start)
+        ids.append({doc.id for doc in result.docs})
+    return latencies, ids
+
+
+def report(name, latencies, ids, truth, k):
+    recall = np.mean([len(found & exact) / k for found, exact in zip(ids, truth)])
+    print(
+        f"{name:>24} {recall:>9.3f} {statistics.median(latencies) * 1000:>9.2f}"
+        f" {np.percentile(latencies, 99) * 1000:>9.2f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--storage", choices=["json", "hash"], default="json")
+    parser.add_argument("--dtype", choices=["FLOAT32", "FLOAT16"], default="FLOAT32")
+    parser.add_argument(
+        "--hnsw",
+        nargs="+",
+        default=["16,200,10", "16,200,50", "32,400,100"],
+        help="M,EF_CONSTRUCTION,EF_RUNTIME triples",
+    )
+    args = parser.parse_args()
+
+    cache = RedisVectorCache(
+        host=args.host,
+        port=args.port,
+        vector_dimension=args.dimension,
+        storage=args.storage,
+        index_config=VectorIndexConfig(dtype=args.dtype),
+    )
+    corpus = make_corpus(args.chunks, args.dimension)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(len(corpus), size=args.queries)
+    queries = corpus[picks] + 0.1 * rng.standard_normal((args.queries, args.dimension))
+
+    indexes = {"FLAT": VectorIndexConfig(algorithm="FLAT", dtype=args.dtype)}
+    for triple in args.hnsw:
+        m, ef_construction, ef_runtime = map(int, triple.split(","))
+        indexes[f"HNSW m={m} efc={ef_construction} efr={ef_runtime}"] = (
+            VectorIndexConfig(
+                algorithm="HNSW",
+                m=m,
+                ef_construction=ef_construction,
+                ef_runtime=ef_runtime,
+                dtype=args.dtype,
+            )
+        )
+    names = {label: f"idx:bench_{i}" for i, label in enumerate(indexes)}
+
+    try:
+        start = time.perf_counter()
+        await seed(cache, corpus)
+        print(f"seeded {len(corpus)} chunks in {time.perf_counter() - start:.1f}s")
+        chunk_bytes = await cache.client.memory_usage(f"{PREFIX}0")
+        print(f"{args.storage} {args.dtype} storage: {chunk_bytes} bytes per chunk")
+
+        for label, config in indexes.items():
+            start = time.perf_counter()
+            await cache._create_index(names[label], args.dimension, config, PREFIX)
+            await wait_indexed(cache, names[label])
+            print(f"built {label} in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'index':>24} {'recall@' + str(args.k):>9} {'p50 ms':>9} {'p99 ms':>9}")
+        _, truth = await run_queries(cache, names["FLAT"], queries, args.k)
+        for label in indexes:
+            latencies, ids = await run_queries(cache, names[label], queries, args.k)
+            report(label, latencies, ids, truth, args.k)
+    finally:
+        for name in names.values():
+            try:
+                await cache.client.ft(name).dropindex(delete_documents=False)
+            except Exception:
+                pass
+        async for key in cache.client.scan_iter(match=f"{PREFIX}*", count=1000):
+            await cache.client.delete(key)
+        await cache.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
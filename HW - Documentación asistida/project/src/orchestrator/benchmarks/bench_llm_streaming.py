@@ -0,0 +1,113 @@
+"""Measures how many concurrent answer streams one orchestrator worker can
+hold, comparing the blocking ChatCompletion.create iteration the orchestrator
+used to do with the async OpenAIChat client.
+
+A fake OpenAI-compatible streaming server runs on a background thread, so no
+API key or network access is needed. Run from src/orchestrator:
+    python -m benchmarks.bench_llm_streaming --streams 1 10 50 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import openai
+from aiohttp import web
+
+from llm import OpenAIChat
+
+
+def start_fake_server(port: int, tokens: int, token_delay: float) -> None:
+    async def completions(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(tokens):
+            await asyncio.sleep(token_delay)
+            chunk = {"choices": [{"index": 0, "delta": {"content": f"tok{i} "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def serve() -> None:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    time.sleep(0.5)
+
+
+async def blocking_stream(prompt: str):
+    """The previous stream_chat, consumed from async code the way it used to be."""
+
+    for chunk in openai.ChatCompletion.create(
+        model="gpt-3.5-turbo",
+        temperature=0.0,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    ):
+        content = chunk["choices"][0].get("delta", {}).get("content")  # type: ignore
+        if content is not None:
+            yield content
+
+
+async def run_level(stream, streams: int):
+    first_token: list[float] = []
+
+    async def client(i: int) -> int:
+        start = time.perf_counter()
+        count = 0
+        async for _ in stream(f"question {i}"):
+            if count == 0:
+                first_token.append(time.perf_counter() - start)
+            count += 1
+            await asyncio.sleep(0)
+        return count
+
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(client(i) for i in range(streams)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed": elapsed,
+        "tokens_per_s": sum(counts) / elapsed,
+        "ttft_p50": statistics.median(first_token) * 1000,
+        "ttft_max": max(first_token) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    start_fake_server(args.port, args.tokens, args.token_delay)
+    openai.api_base = f"http://127.0.0.1:{args.port}/v1"
+    openai.api_key = "fake"
+
+    chat = OpenAIChat()
+    backends = {"blocking": blocking_stream, "async": chat.stream}
+
+    print(
+        f"{'backend':>9} {'streams':>8} {'wall s':>8} {'tokens/s':>10}"
+        f" {'ttft p50 ms':>12} {'ttft max ms':>12}"
+    )
+    for streams in args.streams:
+        for name, stream in backends.items():
+            r = await run_level(stream, streams)
+            print(
+                f"{name:>9} {streams:>8} {r['elapsed']:>8.2f} {r['tokens_per_s']:>10.0f}"
+                f" {r['ttft_p50']:>12.1f} {r['ttft_max']:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""Reports recall@k, query latency and memory of every vector compression mode
+of the chunk cache: FLOAT16 storage, PCA and random projection, alone and
+combined with FLOAT16.
+
+Runs locally on a fixture corpus, without Redis: every mode goes through the
+same compress() the cache applies to stored and query vectors, and is searched
+with an exact scan, so recall only measures what compression loses. The ground
+truth is the exact top-k of the uncompressed vectors. Reducers are fitted on
+the corpus and evaluated on held-out queries.
+
+Run from src/orchestrator:
+    python -m benchmarks.bench_vector_compression --dimensions 128 256 512
+    python -m benchmarks.bench_vector_compression --corpus vectors.npy
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from retrieval.reduction import (
+    PCAReducer,
+    RandomProjectionReducer,
+    VectorReducer,
+    compress,
+)
+from retrieval.similarity import cosine_scores, normalize, top_k
+
+
+def make_fixture(chunks: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Clustered vectors on a low-rank subspace with a decaying spectrum plus
+    noise, the shape real text embeddings have."""
+
+    rng = np.random.default_rng(seed)
+    rank = min(256, dimension)
+    basis = np.linalg.qr(rng.standard_normal((dimension, rank)))[0].T
+    scales = 1 / np.sqrt(np.arange(1, rank + 1))
+    centers = rng.standard_normal((max(chunks // 50, 1), rank)) * scales
+    labels = rng.integers(len(centers), size=chunks)
+    latent = centers[labels] + 0.3 * rng.standard_normal((chunks, rank)) * scales
+    noise = 0.01 * rng.standard_normal((chunks, dimension))
+    return (latent @ basis + noise).astype(np.float32)
+
+
+def search(matrix: np.ndarray, queries: np.ndarray, k: int):
+    """Exact top-k of every query, and the latency of each search."""
+
+    matrix = normalize(matrix.astype(np.float32))
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = top_k(cosine_scores(query, matrix), k)
+        latencies.append(time.perf_counter() - start)
+        ids.append(set(found.tolist()))
+    return latencies, ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", help=".npy matrix of embeddings, one per row")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--fit-sample", type=int, default=5000)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.corpus:
+        vectors = np.load(args.corpus).astype(np.float32)
+    else:
+        vectors = make_fixture(args.chunks + args.queries, args.dimension)
+    queries, corpus = vectors[: args.queries], vectors[args.queries :]
+    dimension = corpus.shape[1]
+    sample = corpus[: args.fit_sample]
+    print(f"{len(corpus)} chunks of {dimension} dimensions, {len(queries)} queries")
+
+    modes: list[tuple[str, VectorReducer | None, str]] = [
+        ("FLOAT32", None, "FLOAT32"),
+        ("FLOAT16", None, "FLOAT16"),
+    ]
+    for output in args.dimensions:
+        pca = PCAReducer(dimension, output).fit(sample)
+        projection = RandomProjectionReducer(dimension, output)
+        modes += [
+            (f"PCA {output}", pca, "FLOAT32"),
+            (f"PCA {output} FLOAT16", pca, "FLOAT16"),
+            (f"random {output}", projection, "FLOAT32"),
+            (f"random {output} FLOAT16", projection, "FLOAT16"),
+        ]
+
+    _, truth = search(corpus, queries, args.k)
+    print(
+        f"{'mode':>22} {'recall@' + str(args.k):>9} {'p50 ms':>8}"
+        f" {'bytes/vec':>10} {'memory':>7}"
+    )
+    for name, reducer, dtype in modes:
+        stored = compress(corpus, reducer, dtype)  # type: ignore
+        asked = compress(queries, reducer, dtype)  # type: ignore
+        latencies, ids = search(stored, asked, args.k)
+        recall = np.mean([len(a & b) / args.k for a, b in zip(ids, truth)])
+        vector_bytes = stored.shape[1] * stored.dtype.itemsize
+        print(
+            f"{name:>22} {recall:>9.3f} {statistics.median(latencies) * 1000:>8.2f}"
+            f" {vector_bytes:>10} {vector_bytes / (dimension * 4):>7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
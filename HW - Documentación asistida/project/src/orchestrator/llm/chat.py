@@ -0,0 +1,74 @@
+from abc import ABC, abstractmethod
+import asyncio
+from typing import AsyncIterator
+
+import openai
+from util import Component
+
+_DONE = object()
+
+
+class ChatClient(Component, ABC):
+    """Abstraction of a streaming chat completion client."""
+
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        pass
+
+
+class OpenAIChat(ChatClient):
+    """Streams OpenAI chat completion tokens without blocking the event loop.
+
+    A producer task reads the response into a bounded queue. When the SSE client
+    reads slower than the model writes, the queue fills up and the producer stops
+    reading until there is room again, so memory per stream stays bounded."""
+
+    def __init__(
+        self, model: str = "gpt-3.5-turbo", temperature: float = 0.0, buffer_size=64
+    ) -> None:
+        self.model = model
+        self.temperature = temperature
+        self.buffer_size = buffer_size
+        self.active_streams = 0
+        self.completed_streams = 0
+
+    async def stats(self) -> dict:
+        return {
+            "active_streams": self.active_streams,
+            "completed_streams": self.completed_streams,
+        }
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_size)
+        producer = asyncio.create_task(self._produce(prompt, queue))
+        self.active_streams += 1
+        try:
+            while (item := await queue.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            self.completed_streams += 1
+        finally:
+            self.active_streams -= 1
+            producer.cancel()
+
+    async def _produce(self, prompt: str, queue: asyncio.Queue) -> None:
+        response = None
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=self.model,
+                temperature=self.temperature,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+            )
+            async for chunk in response:  # type: ignore
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content is not None:
+                    await queue.put(content)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # Also on cancellation: closing the stream closes its aiohttp session.
+            if response is not None:
+                await response.aclose()  # type: ignore
+        await queue.put(_DONE)
@@ -1,76 +1,162 @@
+import os
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from sse_starlette.sse import EventSourceResponse
-from util import logger
+from util import logger, ComponentRegistry
 
 import prompt
-import openai
+from llm import ChatClient, OpenAIChat
 from retrieval import Retriever
-from retrieval.search import GoogleAPI
-from retrieval.cache import RedisVectorCache
+from retrieval.answer_cache import AnswerCache
+from retrieval.fetcher import FetchEngine
+from retrieval.page_cache import PageCache
+from retrieval.parsing import HtmlParser
+from retrieval.search import CachedSearcher, GoogleAPI
+from retrieval.cache import RedisVectorCache, VectorIndexConfig
+from retrieval.reduction import load_reducer
 from retrieval.scraper import ScraperLocal, ScraperRemote
-from retrieval.embeddings import OpenAIEmbeddings, RemoteEmbeddings
+from retrieval.embeddings import (
+    BatchingEmbeddings,
+    CachedEmbeddings,
+    LocalEmbeddings,
+    OpenAIEmbeddings,
+    RemoteEmbeddings,
+)
 from retrieval.splitter import LangChainSplitter
 
-
 # # setup loggers
 # logging.config.fileConfig("logging.conf", disable_existing_loggers=False)  # type: ignore
 # logger = logging.getLogger(__name__)
-app = FastAPI()
-
-
-def stream_chat(prompt: str):
-    for chunk in openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        temperature=0.0,
-        messages=[{"role": "user", "content": prompt}],
-        stream=True,
-    ):
-        content = chunk["choices"][0].get("delta", {}).get("content")  # type: ignore
-        if content is not None:
-            yield content
 
 
-async def event_generator(query) -> AsyncGenerator[dict, None]:
-    redis = RedisVectorCache(host="cache", port=6379)
-    embeddings = OpenAIEmbeddings()
-    google = GoogleAPI()
-    scraper = ScraperLocal()
-    splitter = LangChainSplitter(chunk_size=400, chunk_overlap=50, length_function=len)
+def build_components(registry: ComponentRegistry) -> Retriever:
+    """Registers the shared components and wires the retriever on top of them."""
+
+    # The cache index takes its dimension from the embeddings backend.
+    backend = OpenAIEmbeddings()
+    # backend = RemoteEmbeddings()
+    # Needs requirements-local.txt: build with LOCAL_EMBEDDINGS=1.
+    # backend = LocalEmbeddings(offline=True)
+    # Applied when the index is created. Migrate an existing one with
+    # scripts/migrate_index.py; the dtype and reducer must match the index, see
+    # also scripts/fit_reducer.py.
+    reducer_path = os.environ.get("CACHE_REDUCER")
+    redis = registry.register(
+        "cache",
+        RedisVectorCache(
+            host="cache",
+            port=6379,
+            vector_dimension=backend.vector_dimension,
+            index_config=VectorIndexConfig(
+                algorithm=os.environ.get("CACHE_INDEX_ALGORITHM", "FLAT"),
+                dtype=os.environ.get("CACHE_VECTOR_DTYPE", "FLOAT32"),
+            ),
+            max_bytes=512 * 1024 * 1024,
+            reducer=load_reducer(reducer_path) if reducer_path else None,
+        ),
+    )
+    embeddings = registry.register(
+        "embeddings",
+        CachedEmbeddings(BatchingEmbeddings(backend), redis_client=redis.client),
+    )
+    google = registry.register("searcher", CachedSearcher(GoogleAPI(), ttl=3600))
+    fetcher = registry.register(
+        "fetcher", FetchEngine(limit_per_host=4, max_bytes=2 * 1024 * 1024)
+    )
+    parser = registry.register("parser", HtmlParser(backend="lxml", workers=2))
+    pages = registry.register("pages", PageCache(max_bytes=32 * 1024 * 1024))
+    scraper = registry.register(
+        "scraper", ScraperLocal(engine=fetcher, parser=parser, pages=pages)
+    )
+    splitter = registry.register(
+        "splitter",
+        LangChainSplitter(chunk_size=400, chunk_overlap=50, length_function=len),
+    )
+    registry.register("answers", AnswerCache(redis))
+    registry.register("chat", OpenAIChat(model="gpt-3.5-turbo", temperature=0.0))
 
-    # scraper = ScraperRemoteClient()
-    # embeddings = RemoteEmbeddings()
+    # scraper = ScraperRemote(parser=parser, pages=pages)
 
     # redis.init_test()
-    try:
-        redis.init_index(vector_dimension=embeddings.vector_dimension)
-        logger.info(
-            f"Created index with vector dimensions {embeddings.vector_dimension}"
-        )
-    except:
-        logger.info("Index already exists.")
-
-    retriever = Retriever(
+    return Retriever(
         cache=redis,
         searcher=google,
         scraper=scraper,
         embeddings=embeddings,
         splitter=splitter,
+        deadline=8.0,
+        good_chunk_threshold=0.8,
+        partial_hit_threshold=0.8,
     )
-    async for event in retriever.get_context(query=query, cache_treshold=0.85, k=10):
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry = ComponentRegistry()
+    app.state.registry = registry
+    app.state.retriever = build_components(registry)
+    try:
+        # Inside the try, so a failed warmup still shuts down the others.
+        await registry.startup()
+        yield
+    finally:
+        await registry.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def event_generator(
+    query, retriever: Retriever, answers: AnswerCache, chat: ChatClient
+) -> AsyncGenerator[dict, None]:
+    query_vector = (await retriever.embeddings.run([query]))[0]
+
+    if cached := answers.lookup(query_vector, query):
+        logger.info("ANSWER CACHE HIT")
+        yield {"event": "search", "data": cached.search}
+        yield {"event": "context", "data": cached.context}
+        for text in cached.tokens:
+            yield {"event": "token", "data": text}
+        return
+
+    search, context, tokens, sources = None, None, [], []
+    async for event in retriever.get_context(
+        query=query, cache_treshold=0.85, k=10, query_vector=query_vector
+    ):
+        if event["event"] == "sources":
+            sources = event["data"]
+            continue
         yield event
+        if event["event"] == "search":
+            search = event["data"]
         if event["event"] == "context":
+            context = event["data"]
             final_prompt = prompt.rag.format(context=event["data"], question=query)
 
             yield {"event": "prompt", "data": final_prompt}
 
-            for text in stream_chat(prompt=final_prompt):
+            async for text in chat.stream(prompt=final_prompt):
+                tokens.append(text)
                 yield {"event": "token", "data": text}
 
+    if search is not None and context is not None and tokens:
+        answers.store(query_vector, query, search, context, tokens, sources)
+
 
 @app.get("/streamingSearch")
-async def main(query: str) -> EventSourceResponse:
-    return EventSourceResponse(event_generator(query))
+async def main(query: str, request: Request) -> EventSourceResponse:
+    state = request.app.state
+    return EventSourceResponse(
+        event_generator(
+            query, state.retriever, state.registry["answers"], state.registry["chat"]
+        )
+    )
+
+
+@app.get("/stats")
+async def stats(request: Request) -> dict:
+    return await request.app.state.registry.stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class CachedAnswer(BaseModel):
+    query: str
+    search: str
+    context: str
+    tokens: list[str]
+    chunk_keys: list[str]
+    urls: list[str]
+    created_at: float
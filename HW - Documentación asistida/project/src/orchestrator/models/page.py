@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class FetchedPage(BaseModel):
+    url: str
+    status: int
+    content_type: str
+    body: str
+    truncated: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class CachedPage(BaseModel):
+    url: str
+    text: str
+    size: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float
+    validated_at: float
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import re
+import time
+import numpy as np
+from models.answer import CachedAnswer
+from models.document import Document
+from retrieval.cache import VectorDbCache, chunk_key
+from retrieval.similarity import cosine_scores, normalize, to_matrix
+from util import Component
+
+
+class AnswerCache(Component):
+    """In-process cache of complete answers keyed by query vector.
+
+    A query whose vector is at least `similarity_threshold` similar to a cached
+    one gets the stored answer back. With `match_query`, the two queries must
+    also be equal up to case, punctuation and spacing: questions that differ
+    in a single entity, say the country of a capital, score above 0.95 with
+    ada-002 vectors and would be answered with each other's answer.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted past `max_entries`. An answer is dropped as soon as `chunk_cache`
+    removes a chunk it was built from or writes new chunks of one of its pages."""
+
+    def __init__(
+        self,
+        chunk_cache: VectorDbCache | None = None,
+        similarity_threshold: float = 0.98,
+        match_query: bool = True,
+        ttl: float = 3600,
+        max_entries: int = 1000,
+    ) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.match_query = match_query
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[int, tuple[np.ndarray, CachedAnswer]] = OrderedDict()
+        self._next_id = 0
+        self._ids: list[int] = []
+        self._matrix: np.ndarray | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if chunk_cache is not None:
+            chunk_cache.on_change(self.invalidate)
+
+    async def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+    def lookup(self, query_vector: list[float], query: str) -> CachedAnswer | None:
+        self._expire()
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._ids = list(self._entries)
+            self._matrix = np.stack([self._entries[i][0] for i in self._ids])
+        scores = cosine_scores(query_vector, self._matrix)
+        if self.match_query:
+            query = normalize_query(query)
+            scores = np.where(
+                [self._entries[i][1].query == query for i in self._ids], scores, -1.0
+            )
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        entry_id = self._ids[best]
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id][1]
+
+    def store(
+        self,
+        query_vector: list[float],
+        query: str,
+        search: str,
+        context: str,
+        tokens: list[str],
+        sources: list[Document],
+    ) -> None:
+        """Caches an answer along with the chunks its context was built from."""
+
+        self._expire()
+        answer = CachedAnswer(
+            query=normalize_query(query),
+            search=search,
+            context=context,
+            tokens=tokens,
+            chunk_keys=sorted({chunk_key(doc.text) for doc in sources}),
+            urls=sorted({doc.url for doc in sources}),
+            created_at=time.time(),
+        )
+        vector = normalize(to_matrix([query_vector]))[0]
+        self._entries[self._next_id] = (vector, answer)
+        self._next_id += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._matrix = None
+
+    def invalidate(self, keys: set[str], urls: set[str]) -> None:
+        """Drops the answers built from any of the chunks or pages given."""
+
+        stale = [
+            entry_id
+            for entry_id, (_, answer) in self._entries.items()
+            if keys.intersection(answer.chunk_keys) or urls.intersection(answer.urls)
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        if stale:
+            self.invalidations += len(stale)
+            self._matrix = None
+
+    def _expire(self) -> None:
+        now = time.time()
+        stale = [
+            entry_id
+            for entry_id, (_, answer) in self._entries.items()
+            if now - answer.created_at > self.ttl
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        if stale:
+            self.evictions += len(stale)
+            self._matrix = None
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cased words of the query, without punctuation or extra spacing."""
+
+    return " ".join(re.findall(r"\w+", query.casefold()))
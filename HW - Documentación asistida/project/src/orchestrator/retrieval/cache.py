@@ -1,120 +1,757 @@
 from abc import ABC, abstractmethod
+import asyncio
 import hashlib
 import json
+import re
+import time
+from typing import Callable, Literal
 import numpy as np
 import pandas as pd
-import redis
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
 from redis.commands.search.field import (
+    TagField,
     TextField,
     VectorField,
 )
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
+from redis.commands.search.result import Result
+from pydantic import BaseModel
 from models.document import Document
+from util import Component, logger
+from retrieval.reduction import NUMPY_DTYPES, VectorReducer, VectorType, compress
+from retrieval.similarity import normalize, to_matrix
 
 VECTOR_DIMENSION = 1536
+INDEX_NAME = "idx:chunks_vss"
+KEY_PREFIX = "chunks:"
+# Chunks at least this similar to an existing one are not written again.
+DEDUPE_THRESHOLD = 0.97
+# Seconds a chunk stays cached after it was last written.
+CHUNK_TTL = 3600
+# Seconds a chunk stays cached after find_similar last returned it.
+HIT_TTL = 24 * 3600
+# Bookkeeping for eviction, kept outside the indexed prefix: last access time
+# and hit count of every chunk, its approximate size and the total size.
+META_ACCESS = "meta:chunks:access"
+META_HITS = "meta:chunks:hits"
+META_BYTES = "meta:chunks:bytes"
+META_TOTAL = "meta:chunks:total_bytes"
+EVICTION_BATCH = 100
+# Seconds between sweeps of the bookkeeping of chunks that expired.
+SWEEP_INTERVAL = 600
+# Held by the worker that migrates the index at warmup; the others wait.
+MIGRATION_LOCK = "meta:chunks:migrating"
+MIGRATION_LOCK_TTL = 3600
+# Approximate bytes a vector component takes in a JSON document.
+JSON_BYTES_PER_COMPONENT = 16
 
 
-class VectorDbCache(ABC):
+class VectorIndexConfig(BaseModel):
+    """Vector index algorithm and its tuning parameters.
+
+    FLAT is an exact brute-force scan. HNSW is an approximate graph index whose
+    recall/latency trade-off is set by M, EF_CONSTRUCTION and EF_RUNTIME.
+    FLOAT16 halves the memory of every indexed vector."""
+
+    algorithm: Literal["FLAT", "HNSW"] = "FLAT"
+    dtype: VectorType = "FLOAT32"
+    m: int = 16
+    ef_construction: int = 200
+    ef_runtime: int = 10
+
+    def attributes(self, vector_dimension: int) -> dict:
+        attributes = {
+            "TYPE": self.dtype,
+            "DIM": vector_dimension,
+            "DISTANCE_METRIC": "COSINE",
+        }
+        if self.algorithm == "HNSW":
+            attributes.update(
+                {
+                    "M": self.m,
+                    "EF_CONSTRUCTION": self.ef_construction,
+                    "EF_RUNTIME": self.ef_runtime,
+                }
+            )
+        return attributes
+
+
+class VectorDbCache(Component, ABC):
+    _listeners: list[Callable[[set[str], set[str]], None]]
+
     @abstractmethod
-    async def find_similar(self, vector: list[float], k=10) -> list[Document]:
-        pass
+    async def find_similar(
+        self, vector: list[float], k=10, with_vectors=False, urls=None
+    ) -> list[Document]:
+        """Returns the k nearest chunks, only from `urls` if given. Their vectors
+        are only loaded on request, as stored: reduced and in the index dtype
+        when the cache has a reducer or a FLOAT16 index."""
+
+    @abstractmethod
+    async def cached_urls(self, urls: list[str]) -> set[str]:
+        """Returns the urls that have chunks in the cache."""
 
     @abstractmethod
     async def write(self, documents: list[Document]):
         pass
 
+    def record_lookup(self, outcome: Literal["hit", "partial", "miss"]) -> None:
+        """Counts whether a retrieval was served by the cache, in full or in part."""
+
+    def on_change(self, listener: Callable[[set[str], set[str]], None]) -> None:
+        """Calls `listener(keys, urls)` with the keys of chunks removed from the
+        cache and the urls whose chunks were written anew."""
+
+        self._listeners.append(listener)
+
+    def _notify(self, keys=(), urls=()) -> None:
+        if keys or urls:
+            for listener in self._listeners:
+                listener(set(keys), set(urls))
+
+
+def chunk_key(text: str) -> str:
+    """Redis key of a chunk, derived from its text alone."""
 
-SHA256 = hashlib.sha256()
+    return KEY_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 class RedisVectorCache(VectorDbCache):
+    """Vector cache backed by RediSearch through the non-blocking redis.asyncio client.
+
+    Every instance shares one class-level async connection pool. Chunks are kept
+    either as JSON documents (vector as a float list) or, with storage="hash", as
+    hashes whose vector is packed FLOAT32 bytes.
+
+    With a `reducer`, stored and query vectors alike are reduced before they
+    reach Redis, and the index has the reducer's output dimension. Vectors are
+    stored in the index dtype, so switching the dtype of hash storage or the
+    reducer needs the cache to be refilled.
+
+    Chunks returned by find_similar live on for `hit_ttl` seconds. With a
+    `max_bytes` budget, the least recently ("lru") or least frequently ("lfu")
+    used chunks are evicted once the cached chunks outgrow it."""
+
     _pool = None
 
-    def __init__(self, host, port) -> None:
+    def __init__(
+        self,
+        host,
+        port,
+        vector_dimension=VECTOR_DIMENSION,
+        index_config: VectorIndexConfig = VectorIndexConfig(),
+        storage: Literal["json", "hash"] = "json",
+        hit_ttl: int = HIT_TTL,
+        max_bytes: int | None = None,
+        eviction: Literal["lru", "lfu"] = "lru",
+        reducer: VectorReducer | None = None,
+    ) -> None:
         if RedisVectorCache._pool is None:
-            RedisVectorCache._pool = redis.ConnectionPool(host=host, port=port)
+            RedisVectorCache._pool = aioredis.ConnectionPool(host=host, port=port)
 
-        self.client = redis.Redis(
+        self.client = aioredis.Redis(
             connection_pool=RedisVectorCache._pool, decode_responses=True
         )
+        self.vector_dimension = vector_dimension
+        self.index_config = index_config
+        self.storage = storage
+        self.reducer = reducer
+        self.hit_ttl = hit_ttl
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+
+        self._background: set[asyncio.Task] = set()
+        self._listeners = []
+        self._evicting = False
+        self._swept_at = time.monotonic()
+        self.lookups = {"hit": 0, "partial": 0, "miss": 0}
+        self.touched = 0
+        self.evictions = 0
+
+    async def warmup(self) -> None:
+        """Creates the chunk index unless it already exists.
+
+        An index from before url became a TAG field is migrated in place, as
+        cached_urls and url-filtered queries cannot run on it."""
+
+        try:
+            info = await self.client.ft(INDEX_NAME).info()
+        except ResponseError:
+            try:
+                await self.init_index(vector_dimension=self.index_dimension)
+            except ResponseError as e:
+                if "already exists" not in str(e).lower():
+                    raise
+                # Another worker created it in the meantime.
+                logger.info("Index already exists.")
+                return
+            logger.info(f"Created index with vector dimensions {self.index_dimension}")
+            return
+
+        logger.info("Index already exists.")
+        if _field_type(info, "url") != "TAG":
+            await self._migrate_url_field()
+
+    async def _migrate_url_field(self, poll_interval: float = 0.5) -> None:
+        """Migrates the url field to TAG in a single worker.
+
+        Workers start together, and two migrations would build the same
+        versioned index. The one that takes the lock migrates; the others wait
+        until the index has a TAG url field, and take over if the lock is
+        released before that."""
+
+        while True:
+            if await self.client.set(MIGRATION_LOCK, 1, nx=True, ex=MIGRATION_LOCK_TTL):
+                try:
+                    info = await self.client.ft(INDEX_NAME).info()
+                    if _field_type(info, "url") == "TAG":
+                        return
+                    logger.info("Index has a TEXT url field, migrating it to TAG.")
+                    await self.migrate_index(self.index_config)
+                finally:
+                    await self.client.delete(MIGRATION_LOCK)
+                return
+
+            logger.info("Another worker is migrating the index, waiting.")
+            await asyncio.sleep(poll_interval)
+            info = await self.client.ft(INDEX_NAME).info()
+            if _field_type(info, "url") == "TAG":
+                return
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await self.client.aclose()
+        if RedisVectorCache._pool is not None:
+            await RedisVectorCache._pool.disconnect()
+            RedisVectorCache._pool = None
+
+    async def find_similar(
+        self, vector: list[float], k=10, with_vectors=False, urls=None
+    ) -> list[Document]:
+        if urls is not None and not urls:
+            return []
+        result = await self.client.ft(INDEX_NAME).search(
+            self._knn_query(
+                k, with_vectors=with_vectors and self.storage == "json", urls=urls
+            ),
+            {"query_vector": self._vector_bytes(vector)},
+        )
+        documents = self._to_documents(result)
+        if with_vectors and self.storage == "hash":
+            await self._load_vectors(result.docs, documents)
+        if result.docs:
+            # Off the request path: nothing waits for the bookkeeping.
+            self._in_background(self._touch([hit.id for hit in result.docs]))
+        return documents
+
+    def _in_background(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def stats(self) -> dict:
+        info = await self.client.ft(INDEX_NAME).info()
+        total = await self.client.get(META_TOTAL)
+        lookups = sum(self.lookups.values())
+        return {
+            **self.lookups,
+            "hit_rate": self.lookups["hit"] / lookups if lookups else 0.0,
+            "chunks": int(info["num_docs"]),
+            "bytes": int(total or 0),
+            "max_bytes": self.max_bytes,
+            "touched": self.touched,
+            "evictions": self.evictions,
+        }
+
+    def record_lookup(self, outcome: Literal["hit", "partial", "miss"]) -> None:
+        self.lookups[outcome] += 1
+
+    async def _touch(self, keys: list[str]) -> None:
+        """Extends the TTL of chunks that were just served and records the access."""
+
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            # GT never shortens the TTL of a chunk that was written recently.
+            pipeline.expire(key, self.hit_ttl, gt=True)
+            pipeline.zadd(META_ACCESS, {key: now})
+            pipeline.zincrby(META_HITS, 1, key)
+        try:
+            await pipeline.execute()
+            self.touched += len(keys)
+        except Exception as e:
+            logger.info(f"CACHE TOUCH FAILED: {e!r}")
+
+    async def cached_urls(self, urls: list[str]) -> set[str]:
+        """Counts the chunks of every url on the url TAG field, in one round trip."""
 
-    async def find_similar(self, vector: list[float], k=10) -> list[Document]:
-        chunks = (
-            self.client.ft("idx:chunks_vss")
-            .search(
-                Query(f"(*)=>[KNN {k} @vector $query_vector AS vector_score]")
-                .sort_by("vector_score")
-                .return_fields("vector_score", "text", "url", "vector")
-                .dialect(2),
-                {"query_vector": np.array(vector, dtype=np.float32).tobytes()},
+        if not urls:
+            return set()
+
+        pipeline = self.client.pipeline(transaction=False)
+        for url in urls:
+            pipeline.execute_command(
+                "FT.SEARCH", INDEX_NAME, _url_filter([url]), "LIMIT", 0, 0
+            )
+        counts = await pipeline.execute()
+        return {url for url, res in zip(urls, counts) if int(res[0]) > 0}
+
+    async def _load_vectors(self, hits, documents: list[Document]):
+        """Fetches packed vectors of hash chunks, which FT.SEARCH cannot return intact."""
+
+        pipeline = self.client.pipeline(transaction=False)
+        for hit in hits:
+            pipeline.hget(hit.id, "vector")
+        for document, raw in zip(documents, await pipeline.execute()):
+            if raw is not None:
+                document.vector = np.frombuffer(
+                    raw, dtype=NUMPY_DTYPES[self.index_config.dtype]
+                ).tolist()
+
+    async def find_similar_many(
+        self, vectors: list[list[float]], k=10
+    ) -> list[list[Document]]:
+        """Runs one KNN query per vector, all of them in a single round trip."""
+
+        if not vectors:
+            return []
+
+        query = self._knn_query(k)
+        pipeline = self.client.pipeline(transaction=False)
+        for vector in vectors:
+            pipeline.execute_command(
+                "FT.SEARCH",
+                INDEX_NAME,
+                *query.get_args(),
+                "PARAMS",
+                2,
+                "query_vector",
+                self._vector_bytes(vector),
             )
-            .docs  # type: ignore
+        responses = await pipeline.execute()
+
+        return [self._to_documents(Result(res, True)) for res in responses]
+
+    async def get_insertables(self, documents: list[Document]) -> list[Document]:
+        """Drops documents that are near duplicates of each other or of cached chunks.
+
+        Candidates are compared with each other in-process, and the survivors are
+        checked against Redis with one pipelined batch of KNN queries."""
+
+        if not documents:
+            return []
+
+        matrix = normalize(to_matrix([document.vector for document in documents]))
+        candidates = [documents[i] for i in self._unique_rows(matrix)]
+
+        nearest = await self.find_similar_many(
+            [document.vector for document in candidates], k=1
         )
-        documents = map(
-            lambda doc: Document(
+        return [
+            document
+            for document, results in zip(candidates, nearest)
+            if not results or results[0].similarity < DEDUPE_THRESHOLD
+        ]
+
+    @staticmethod
+    def _unique_rows(matrix: np.ndarray) -> list[int]:
+        """Indices of the rows kept after greedy in-batch deduplication."""
+
+        duplicates = np.triu(matrix @ matrix.T, k=1) >= DEDUPE_THRESHOLD
+        keep = np.ones(len(matrix), dtype=bool)
+        for i in range(len(matrix)):
+            if keep[i]:
+                keep[duplicates[i]] = False
+        return np.flatnonzero(keep).tolist()
+
+    @staticmethod
+    def _knn_query(k: int, with_vectors: bool = False, urls=None) -> Query:
+        # HNSW indexes use the EF_RUNTIME they were created with.
+        fields = ["vector_score", "text", "url"] + (["vector"] if with_vectors else [])
+        prefilter = "*" if urls is None else _url_filter(urls)
+        return (
+            Query(f"({prefilter})=>[KNN {k} @vector $query_vector AS vector_score]")
+            .sort_by("vector_score")
+            .return_fields(*fields)
+            .paging(0, k)
+            .dialect(2)
+        )
+
+    @property
+    def index_dimension(self) -> int:
+        if self.reducer is not None:
+            return self.reducer.output_dimension
+        return self.vector_dimension
+
+    def _vector_bytes(self, vector: list[float]) -> bytes:
+        return compress([vector], self.reducer, self.index_config.dtype)[0].tobytes()
+
+    @staticmethod
+    def _to_documents(result: Result) -> list[Document]:
+        return [
+            Document(
                 url=doc.url,
                 text=doc.text,
-                vector=json.loads(doc.vector),
+                vector=json.loads(doc.vector) if hasattr(doc, "vector") else [],
                 similarity=1 - float(doc.vector_score),
-            ),
-            chunks,
-        )
+            )
+            for doc in result.docs
+        ]
 
-        return list(documents)
+    async def write(self, documents: list[Document]):
+        """Stores the chunks not cached yet and refreshes the TTL of the others.
 
-    async def get_insertables(self, documents: list[Document]) -> list[Document]:
-        insertables = []
-        for document in documents:
-            results = await self.find_similar(document.vector, k=1)
-            if not results:
-                insertables.append(document)
-            elif results[0].similarity < 0.97:
-                insertables.append(document)
-        return insertables
+        Keys are content hashes, so a chunk that is already cached only gets its
+        expiry pushed back and its vector is not sent again. Chunks are set only
+        if absent, so of concurrent writers of a chunk only one stores it and
+        accounts for its size."""
 
-    async def write(self, documents: list[Document]):
-        documents = await self.get_insertables(documents)
+        by_key = {chunk_key(document.text): document for document in documents}
+        if not by_key:
+            return
+
+        pipeline = self.client.pipeline(transaction=False)
+        for redis_key in by_key:
+            pipeline.expire(redis_key, CHUNK_TTL, gt=True)
+            pipeline.exists(redis_key)
+        replies = await pipeline.execute()
+        absent = [
+            doc for doc, exists in zip(by_key.values(), replies[1::2]) if not exists
+        ]
+
+        documents = await self.get_insertables(absent)
         pipeline = self.client.pipeline()
+        replies_at = []
         for document in documents:
-            SHA256.update(document.text.encode("utf-8"))
-            chunk_id = SHA256.hexdigest()
-            redis_key = f"chunks:{chunk_id}"
+            redis_key = chunk_key(document.text)
             document.similarity = -1
-            pipeline.json().set(redis_key, "$", document.model_dump())
-            pipeline.expire(redis_key, 3600)
+            replies_at.append(len(pipeline))
+            self._set_chunk(pipeline, redis_key, document.model_dump(), nx=True)
+            # A chunk another writer stored first keeps its own expiry.
+            pipeline.expire(redis_key, CHUNK_TTL, nx=True)
+        replies = await pipeline.execute()
+        documents = [doc for doc, at in zip(documents, replies_at) if replies[at]]
+
+        now = time.time()
+        hits = await self._new_chunk_hits() if documents else 0
+        sizes = [self._chunk_bytes(document) for document in documents]
+        pipeline = self.client.pipeline(transaction=False)
+        for document, size in zip(documents, sizes):
+            redis_key = chunk_key(document.text)
+            pipeline.zadd(META_ACCESS, {redis_key: now})
+            pipeline.zadd(META_HITS, {redis_key: hits}, nx=True)
+            pipeline.hset(META_BYTES, redis_key, size)
+        replies = await pipeline.execute()
+
+        # A size still recorded for an expired copy of the chunk, which has the
+        # same text, is already in the total until the next sweep removes it.
+        added_bytes = sum(size for size, new in zip(sizes, replies[2::3]) if new)
+        if added_bytes:
+            await self.client.incrby(META_TOTAL, added_bytes)
+        if documents:
+            self._notify(urls={document.url for document in documents})
+            if time.monotonic() - self._swept_at >= SWEEP_INTERVAL:
+                self._swept_at = time.monotonic()
+                self._in_background(self._sweep())
+            if self.max_bytes is not None and not self._evicting:
+                # One eviction at a time; it rereads the total as it goes.
+                self._evicting = True
+                self._in_background(self._evict())
+
+    async def _new_chunk_hits(self) -> float:
+        """Hit count new chunks start from: in LFU mode, one above the coldest
+        chunk, so a chunk is not the first to go before it could be hit."""
+
+        if self.eviction != "lfu":
+            return 0
+        coldest = await self.client.zrange(META_HITS, 0, 0, withscores=True)
+        return coldest[0][1] + 1 if coldest else 0
+
+    def _chunk_bytes(self, document: Document) -> int:
+        return (
+            len(document.text.encode("utf-8"))
+            + len(document.url)
+            + self._component_bytes() * self.index_dimension
+        )
+
+    def _component_bytes(self) -> int:
+        if self.storage == "json":
+            return JSON_BYTES_PER_COMPONENT
+        return np.dtype(NUMPY_DTYPES[self.index_config.dtype]).itemsize
+
+    async def _sweep(self) -> None:
+        """Drops the bookkeeping of chunks that expired and takes their size off
+        the total, so they neither count against max_bytes nor outrank live
+        chunks in the eviction order."""
+
+        removed = freed = 0
+        async for raw_keys in self._scan_accessed():
+            keys = [_to_str(key) for key in raw_keys]
+            pipeline = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipeline.exists(key)
+            gone = [
+                key for key, exists in zip(keys, await pipeline.execute()) if not exists
+            ]
+            if not gone:
+                continue
 
-        pipeline.execute()
+            sizes = [
+                int(size or 0) for size in await self.client.hmget(META_BYTES, gone)
+            ]
+            pipeline = self.client.pipeline(transaction=False)
+            for key in gone:
+                pipeline.hdel(META_BYTES, key)
+            pipeline.zrem(META_ACCESS, *gone)
+            pipeline.zrem(META_HITS, *gone)
+            replies = await pipeline.execute()
+            # As in _evict, only whoever removed a size accounts for it.
+            freed += sum(size for size, deleted in zip(sizes, replies) if deleted)
+            removed += len(gone)
+            self._notify(keys=gone)
+        if freed:
+            await self.client.decrby(META_TOTAL, freed)
+        if removed:
+            logger.info(f"CACHE SWEEP: {removed} expired chunks, {freed} bytes")
 
-    def init_test(self):
+    async def _scan_accessed(self):
+        """Batches of the chunk keys that have bookkeeping."""
+
+        cursor = None
+        while cursor != 0:
+            cursor, entries = await self.client.zscan(
+                META_ACCESS, cursor or 0, count=EVICTION_BATCH
+            )
+            if entries:
+                yield [key for key, _ in entries]
+
+    async def _evict(self) -> None:
+        """Deletes the coldest chunks until the cache fits in max_bytes.
+
+        Bookkeeping of expired chunks that rank coldest is cleaned up on the
+        way; _sweep removes the rest, such as often hit chunks in LFU mode."""
+
+        try:
+            await self._evict_coldest()
+        finally:
+            self._evicting = False
+
+    async def _evict_coldest(self) -> None:
+        ranking = META_ACCESS if self.eviction == "lru" else META_HITS
+        total = int(await self.client.get(META_TOTAL) or 0)
+        evicted = 0
+        while total > self.max_bytes:  # type: ignore
+            coldest = [
+                _to_str(key)
+                for key in await self.client.zrange(ranking, 0, EVICTION_BATCH - 1)
+            ]
+            if not coldest:
+                break
+
+            # Only as many of the coldest chunks as it takes to fit the budget.
+            sizes = [
+                int(size or 0) for size in await self.client.hmget(META_BYTES, coldest)
+            ]
+            over = np.cumsum(sizes) >= total - self.max_bytes  # type: ignore
+            count = int(np.argmax(over)) + 1 if over.any() else len(coldest)
+            victims = coldest[:count]
+
+            pipeline = self.client.pipeline(transaction=False)
+            for key in victims:
+                pipeline.hdel(META_BYTES, key)
+                pipeline.delete(key)
+            pipeline.zrem(META_ACCESS, *victims)
+            pipeline.zrem(META_HITS, *victims)
+            replies = await pipeline.execute()
+
+            # Concurrent evictions may pick the same victims; only whoever
+            # removed a size accounts for it.
+            freed = sum(
+                size for size, removed in zip(sizes, replies[0:-2:2]) if removed
+            )
+            evicted += sum(replies[1:-2:2])
+            self._notify(
+                keys=[key for key, deleted in zip(victims, replies[1:-2:2]) if deleted]
+            )
+            total = await self.client.decrby(META_TOTAL, freed)
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"CACHE EVICTIONS: {evicted}")
+
+    async def init_test(self):
         df = pd.read_pickle("mocks/database_pickle")
         df["vector"] = df["vector"].apply(lambda x: x.tolist()[0])
         chunks = df.to_dict("records")
 
         pipeline = self.client.pipeline()
         for chunk in chunks:
-            SHA256.update(chunk["text"].encode("utf-8"))
-            chunk_id = SHA256.hexdigest()
-            redis_key = f"chunks:{chunk_id}"
-            pipeline.json().set(redis_key, "$", chunk)
-        pipeline.execute()
+            self._set_chunk(pipeline, chunk_key(chunk["text"]), chunk)
+        await pipeline.execute()
+
+    def _set_chunk(self, pipeline, redis_key: str, chunk: dict, nx: bool = False):
+        """Queues the write of a chunk. With nx, the first reply queued tells
+        whether the chunk was absent and got written."""
+
+        if self.storage == "hash":
+            fields = {
+                "vector": self._vector_bytes(chunk["vector"]),
+                "text": chunk["text"],
+                "url": chunk["url"],
+            }
+            if nx:
+                # In a transaction, either every field or none is set.
+                for name, value in fields.items():
+                    pipeline.hsetnx(redis_key, name, value)
+            else:
+                pipeline.hset(redis_key, mapping=fields)
+        else:
+            vector = compress([chunk["vector"]], self.reducer, self.index_config.dtype)
+            pipeline.json().set(
+                redis_key, "$", {**chunk, "vector": vector[0].tolist()}, nx=nx
+            )
 
-    def init_index(self, vector_dimension):
+    async def init_index(self, vector_dimension):
+        await self._create_index(INDEX_NAME, vector_dimension, self.index_config)
+
+    async def migrate_index(
+        self, index_config: VectorIndexConfig, poll_interval: float = 0.5
+    ) -> str:
+        """Rebuilds the chunk index with a new configuration, keeping the cached chunks.
+
+        A versioned index is built next to the live one over the same key prefix.
+        Once it has indexed every chunk, INDEX_NAME becomes an alias of the new
+        index and the old index is dropped without deleting its documents.
+        The new index covers the same kind of keys, hash or JSON, as the live one.
+
+        Stored vectors are not re-encoded, so a configuration they do not match
+        is refused. Queries must use the new dtype once the alias moves."""
+
+        info = await self.client.ft(INDEX_NAME).info()
+        current = _to_str(info["index_name"])
+        self.storage = storage_type(info)
+        await self._check_stored_vectors(index_config)
+        target = f"{INDEX_NAME}:{int(time.time())}"
+        await self._create_index(target, self.index_dimension, index_config)
+
+        while True:
+            info = await self.client.ft(target).info()
+            if float(info["percent_indexed"]) >= 1 and not int(info["indexing"]):
+                break
+            await asyncio.sleep(poll_interval)
+
+        if current == INDEX_NAME:
+            # The alias cannot share the name of a live index, so it is added
+            # in the same transaction that drops the index: no query sees the
+            # name missing.
+            pipeline = self.client.pipeline(transaction=True)
+            pipeline.execute_command("FT.DROPINDEX", current)
+            pipeline.execute_command("FT.ALIASADD", INDEX_NAME, target)
+            await pipeline.execute()
+        else:
+            await self.client.ft(target).aliasupdate(INDEX_NAME)
+            await self.client.ft(current).dropindex(delete_documents=False)
+
+        self.index_config = index_config
+        logger.info(f"Migrated {INDEX_NAME} from {current} to {target}")
+        return target
+
+    async def _check_stored_vectors(self, index_config: VectorIndexConfig) -> None:
+        """Raises if a cached vector would be left out of an index with `index_config`.
+
+        Hash vectors are packed in the index dtype and all vectors have the
+        reducer's dimension; chunks that do not match are silently not indexed."""
+
+        async for key in self.client.scan_iter(match=f"{KEY_PREFIX}*", count=100):
+            if self.storage == "hash":
+                stored = len(await self.client.hget(key, "vector") or b"")
+                itemsize = np.dtype(NUMPY_DTYPES[index_config.dtype]).itemsize
+                expected = self.index_dimension * itemsize
+                unit = "bytes"
+            else:
+                vector = await self.client.json().get(key, "$.vector")
+                stored = len(vector[0]) if vector else 0
+                expected = self.index_dimension
+                unit = "components"
+            if stored != expected:
+                raise ValueError(
+                    f"Cached vectors have {stored} {unit} but a {index_config.dtype} "
+                    f"index of dimension {self.index_dimension} needs {expected}; "
+                    "refill the cache instead of migrating it"
+                )
+            return
+
+    async def _create_index(
+        self,
+        index_name: str,
+        vector_dimension: int,
+        index_config: VectorIndexConfig,
+        prefix: str = KEY_PREFIX,
+    ):
+        # JSON documents are indexed by path, hash fields by name.
+        path = "$." if self.storage == "json" else ""
         schema = (
-            TextField("$.text", no_stem=True, as_name="text"),
-            TextField("$.url", no_stem=True, as_name="url"),
+            TextField(f"{path}text", no_stem=True, as_name="text"),
+            # Exact-match and case-sensitive, for cached_urls and url-filtered
+            # KNN queries. No URL contains a space, so it separates nothing.
+            TagField(f"{path}url", separator=" ", case_sensitive=True, as_name="url"),
             VectorField(
-                "$.vector",
-                "FLAT",
-                {
-                    "TYPE": "FLOAT32",
-                    "DIM": vector_dimension,
-                    "DISTANCE_METRIC": "COSINE",
-                },
+                f"{path}vector",
+                index_config.algorithm,
+                index_config.attributes(vector_dimension),
                 as_name="vector",
             ),
         )
-        definition = IndexDefinition(prefix=["chunks:"], index_type=IndexType.JSON)
-        self.client.ft("idx:chunks_vss").create_index(
+        index_type = IndexType.JSON if self.storage == "json" else IndexType.HASH
+        definition = IndexDefinition(prefix=[prefix], index_type=index_type)
+        await self.client.ft(index_name).create_index(
             fields=schema, definition=definition
         )
+
+
+def _url_filter(urls) -> str:
+    """TAG query matching chunks of any of the urls."""
+
+    escaped = (re.sub(r"([^A-Za-z0-9_])", r"\\\1", url) for url in urls)
+    return "@url:{" + " | ".join(escaped) + "}"
+
+
+def _pairs(reply) -> dict:
+    """Maps a flat [name, value, ...] FT.INFO reply to a dict."""
+
+    return {_to_str(name): value for name, value in zip(reply[::2], reply[1::2])}
+
+
+def storage_type(info: dict) -> Literal["json", "hash"]:
+    """Storage of the chunks an index covers, from its FT.INFO reply."""
+
+    key_type = _to_str(_pairs(info["index_definition"])["key_type"])
+    return "hash" if key_type == "HASH" else "json"
+
+
+def vector_type(info: dict) -> str | None:
+    """Data type of the indexed vectors, from FT.INFO; None if not reported."""
+
+    return _field_option(info, "vector", "data_type")
+
+
+def _field_type(info: dict, name: str) -> str | None:
+    """Type of the `name` attribute of an index, from its FT.INFO reply."""
+
+    return _field_option(info, name, "type")
+
+
+def _field_option(info: dict, name: str, option: str) -> str | None:
+    for attribute in info["attributes"]:
+        values = [_to_str(value) for value in attribute]
+        lowered = [value.lower() for value in values]
+        if values[lowered.index("attribute") + 1] == name:
+            if option not in lowered:
+                return None
+            return values[lowered.index(option) + 1]
+    return None
+
+
+def _to_str(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
@@ -1,13 +1,29 @@
 from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
 import aiohttp
+import numpy as np
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 
 import openai
+from util import Component, logger
 
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a characters-per-token estimate
+    tiktoken = None
 
-class Embeddings(ABC):
+
+class Embeddings(Component, ABC):
     """Abstraction of embeddings client."""
 
+    vector_dimension: int
+    model: str
+
     @abstractmethod
     async def run(self, chunks: list[str]) -> list[list[float]]:
         pass
@@ -17,6 +33,7 @@ class RemoteEmbeddings(Embeddings):
     """Instanciates a client that implements _embeddings service."""
 
     vector_dimension = 384
+    model = "remote"
 
     async def run(self, chunks: list[str]) -> list[list[float]]:
         url = f"http://embeddings/encode"
@@ -34,10 +51,406 @@ class OpenAIEmbeddings(Embeddings):
     """OpenAI embeddings client wrapper"""
 
     vector_dimension = 1536
+    model = "text-embedding-ada-002"
 
-    async def run(
-        self, chunks: list[str], model="text-embedding-ada-002"
-    ) -> list[list[float]]:
+    async def run(self, chunks: list[str], model=None) -> list[list[float]]:
+        model = model or self.model
         response = await openai.Embedding.acreate(input=chunks, model=model)
         vectors = map(lambda x: x["embedding"], response["data"])  # type: ignore
         return list(vectors)
+
+
+class LocalEmbeddings(Embeddings):
+    """Sentence-transformers model run on CPU inside this process.
+
+    The model loads at warmup from a local path or the Hugging Face cache; with
+    offline=True the hub is never contacted, so embedding needs no network at
+    all. Inputs are encoded in batches of `batch_size` on `workers` threads,
+    as PyTorch releases the GIL while it computes. Needs the packages in
+    requirements-local.txt, which the image installs when built with
+    LOCAL_EMBEDDINGS=1."""
+
+    vector_dimension = 384
+    model = "sentence-transformers/all-MiniLM-L6-v2"
+
+    def __init__(
+        self,
+        model: str | None = None,
+        vector_dimension: int | None = None,
+        batch_size: int = 32,
+        workers: int = 1,
+        device: str = "cpu",
+        offline: bool = False,
+    ) -> None:
+        self.model = model or self.model
+        self.vector_dimension = vector_dimension or self.vector_dimension
+        self.batch_size = batch_size
+        self.device = device
+        self.offline = offline
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="embeddings"
+        )
+        self._encoder = None
+        self._loading = asyncio.Lock()
+        self.inputs = 0
+        self.batches = 0
+
+    async def warmup(self) -> None:
+        async with self._loading:
+            if self._encoder is None:
+                loop = asyncio.get_running_loop()
+                self._encoder = await loop.run_in_executor(self._executor, self._load)
+
+    async def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def stats(self) -> dict:
+        return {"inputs": self.inputs, "batches": self.batches}
+
+    def _load(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "LocalEmbeddings needs the sentence-transformers package"
+            ) from e
+
+        encoder = SentenceTransformer(
+            self.model, device=self.device, local_files_only=self.offline
+        )
+        dimension = encoder.get_sentence_embedding_dimension()
+        if dimension != self.vector_dimension:
+            raise ValueError(
+                f"{self.model} embeds in {dimension} dimensions,"
+                f" not {self.vector_dimension}"
+            )
+        return encoder
+
+    async def run(self, chunks: list[str]) -> list[list[float]]:
+        if not chunks:
+            return []
+        await self.warmup()
+
+        loop = asyncio.get_running_loop()
+        batches = [
+            chunks[i : i + self.batch_size]
+            for i in range(0, len(chunks), self.batch_size)
+        ]
+        encoded = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, self._encode, b) for b in batches)
+        )
+        self.inputs += len(chunks)
+        self.batches += len(batches)
+        return [vector for batch in encoded for vector in batch]
+
+    def _encode(self, batch: list[str]) -> list[list[float]]:
+        vectors = self._encoder.encode(  # type: ignore
+            batch,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        return vectors.astype(np.float32).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses upstream.
+
+    Vectors are keyed by a hash of the model and the text. They are kept in an
+    in-process LRU bounded by size in bytes and, optionally, in Redis so that
+    every worker shares them. Redis errors are logged and the call goes on
+    without it."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_bytes: int = 64 * 1024 * 1024,
+        redis_client: aioredis.Redis | None = None,
+        redis_ttl: int = 24 * 3600,
+        redis_prefix: str = "embeddings:",
+    ) -> None:
+        self.embeddings = embeddings
+        self.vector_dimension = embeddings.vector_dimension
+        self.model = embeddings.model
+        self.max_bytes = max_bytes
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+        self.redis_prefix = redis_prefix
+
+        self._lru: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lru_bytes = 0
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    async def warmup(self) -> None:
+        await self.embeddings.warmup()
+
+    async def shutdown(self) -> None:
+        await self.embeddings.shutdown()
+
+    async def stats(self) -> dict:
+        stats = {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "entries": len(self._lru),
+            "bytes": self._lru_bytes,
+        }
+        if upstream := await self.embeddings.stats():
+            stats["upstream"] = upstream
+        return stats
+
+    async def run(self, chunks: list[str]) -> list[list[float]]:
+        keys = [self._key(chunk) for chunk in chunks]
+        texts = dict(zip(keys, chunks))
+        found: dict[str, np.ndarray] = {}
+        for key in texts:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                found[key] = self._lru[key]
+        from_memory = set(found)
+
+        missing = [key for key in texts if key not in found]
+        if missing and self.redis_client is not None:
+            try:
+                stored = await self.redis_client.mget(
+                    [self.redis_prefix + key for key in missing]
+                )
+            except RedisError as e:
+                self._redis_failed("read", e)
+                stored = []
+            for key, raw in zip(missing, stored):
+                if raw is not None:
+                    found[key] = np.frombuffer(raw, dtype=np.float32)
+                    self._remember(key, found[key])
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            vectors = await self.embeddings.run([texts[key] for key in missing])
+            if len(vectors) != len(missing):
+                raise ValueError(
+                    f"{len(vectors)} vectors returned for {len(missing)} inputs"
+                )
+            for key, vector in zip(missing, vectors):
+                found[key] = np.asarray(vector, dtype=np.float32)
+            # An empty vector is how an upstream failure looks, never cache it.
+            valid = [key for key in missing if found[key].size]
+            for key in valid:
+                self._remember(key, found[key])
+            await self._store(valid, found)
+
+        upstream = set(missing)
+        for key in keys:
+            if key in from_memory:
+                self.hits += 1
+            elif key in upstream:
+                self.misses += 1
+            else:
+                self.redis_hits += 1
+
+        return [found[key].tolist() for key in keys]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if key in self._lru:
+            return
+        self._lru[key] = vector
+        self._lru_bytes += vector.nbytes
+        while self._lru_bytes > self.max_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._lru_bytes -= evicted.nbytes
+
+    async def _store(self, keys: list[str], vectors: dict[str, np.ndarray]) -> None:
+        if self.redis_client is None:
+            return
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.set(
+                self.redis_prefix + key, vectors[key].tobytes(), ex=self.redis_ttl
+            )
+        try:
+            await pipeline.execute()
+        except RedisError as e:
+            self._redis_failed("write", e)
+
+    def _redis_failed(self, operation: str, error: RedisError) -> None:
+        self.redis_errors += 1
+        logger.info(f"EMBEDDING CACHE {operation.upper()} FAILED: {error!r}")
+
+
+class BatchingEmbeddings(Embeddings):
+    """Merges concurrent embedding requests into shared upstream calls.
+
+    Requests arriving within `window` seconds of each other are combined,
+    deduplicated and re-split into sub-batches that respect the provider's
+    input and token limits; inputs longer than `max_input_tokens` are
+    truncated. Sub-batches are sent in parallel and every caller gets back its
+    own vectors, in the order it asked for them. When a shared call fails, the
+    requests merged into it are retried one by one, so only the request with
+    the bad input fails."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        window: float = 0.01,
+        max_batch_inputs: int = 2048,
+        max_batch_tokens: int = 100_000,
+        max_input_tokens: int = 8191,
+    ) -> None:
+        self.embeddings = embeddings
+        self.vector_dimension = embeddings.vector_dimension
+        self.model = embeddings.model
+        self.window = window
+        self.max_batch_inputs = max_batch_inputs
+        self.max_batch_tokens = max_batch_tokens
+        self.max_input_tokens = max_input_tokens
+
+        self._queue: list[tuple[list[str], asyncio.Future]] = []
+        self._queued_inputs = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._sending: set[asyncio.Task] = set()
+        self._encoding = None
+        self.requests = 0
+        self.upstream_calls = 0
+        self.retries = 0
+        self.truncated = 0
+
+    async def warmup(self) -> None:
+        if tiktoken is not None:
+            try:
+                # Downloads the encoding on first use.
+                self._encoding = await asyncio.to_thread(
+                    tiktoken.encoding_for_model, self.model
+                )
+            except Exception as e:
+                logger.info(f"TOKEN COUNT ESTIMATED: {e!r}")
+        await self.embeddings.warmup()
+
+    async def shutdown(self) -> None:
+        self._flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        await self.embeddings.shutdown()
+
+    async def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "retries": self.retries,
+            "truncated": self.truncated,
+        }
+
+    async def run(self, chunks: list[str]) -> list[list[float]]:
+        if not chunks:
+            return []
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((chunks, future))
+        self._queued_inputs += len(chunks)
+        self.requests += 1
+
+        if self._queued_inputs >= self.max_batch_inputs:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _fit(self, text: str) -> tuple[str, int]:
+        """The text cut to max_input_tokens, and its token count."""
+
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text)
+            if len(tokens) <= self.max_input_tokens:
+                return text, len(tokens)
+            self.truncated += 1
+            fitted = self._encoding.decode(tokens[: self.max_input_tokens])
+            return fitted, self.max_input_tokens
+
+        estimate = len(text) // 4 + 1
+        if estimate <= self.max_input_tokens:
+            return text, estimate
+        self.truncated += 1
+        return text[: 4 * (self.max_input_tokens - 1)], self.max_input_tokens
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        requests, self._queue = self._queue, []
+        self._queued_inputs = 0
+        if requests:
+            task = asyncio.create_task(self._send(requests))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    def _sub_batches(self, texts: dict[str, int]) -> list[list[str]]:
+        """Splits texts, mapped to their token counts, into upstream calls."""
+
+        batches: list[list[str]] = [[]]
+        tokens = 0
+        for text, text_tokens in texts.items():
+            full = len(batches[-1]) >= self.max_batch_inputs
+            if batches[-1] and (full or tokens + text_tokens > self.max_batch_tokens):
+                batches.append([])
+                tokens = 0
+            batches[-1].append(text)
+            tokens += text_tokens
+        return batches
+
+    async def _send(
+        self,
+        requests: list[tuple[list[str], asyncio.Future]],
+        fitted: dict[str, tuple[str, int]] | None = None,
+    ) -> None:
+        try:
+            texts = dict.fromkeys(text for chunks, _ in requests for text in chunks)
+            fitted = fitted or {text: self._fit(text) for text in texts}
+            batches = self._sub_batches({text: fitted[text][1] for text in texts})
+            self.upstream_calls += len(batches)
+            results = await asyncio.gather(
+                *(
+                    self.embeddings.run([fitted[text][0] for text in batch])
+                    for batch in batches
+                ),
+                return_exceptions=True,
+            )
+
+            vectors: dict[str, list[float]] = {}
+            errors: dict[str, BaseException] = {}
+            for batch, result in zip(batches, results):
+                if not isinstance(result, BaseException) and len(result) != len(batch):
+                    result = ValueError(
+                        f"{len(result)} vectors returned for {len(batch)} inputs"
+                    )
+                if isinstance(result, BaseException):
+                    errors.update(dict.fromkeys(batch, result))
+                else:
+                    vectors.update(zip(batch, result))
+
+            failed = []
+            for chunks, future in requests:
+                if future.done():
+                    continue
+                error = next((errors[text] for text in chunks if text in errors), None)
+                if error is None:
+                    future.set_result([vectors[text] for text in chunks])
+                elif len(requests) > 1:
+                    failed.append((chunks, future))
+                else:
+                    future.set_exception(error)
+
+            # A failed call may have held other callers' bad inputs; alone, a
+            # request only fails on its own.
+            self.retries += len(failed)
+            await asyncio.gather(*(self._send([request], fitted) for request in failed))
+        except Exception as e:
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,135 @@
+import asyncio
+import aiohttp
+from models.page import FetchedPage
+from util import Component, logger
+
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+
+class FetchEngine(Component):
+    """Shared HTTP client for the scrapers.
+
+    A single aiohttp session reuses connections and caches DNS lookups, and
+    caps the connections open to any one host. Responses whose content type is
+    not allowed are dropped from their headers alone, and bodies are streamed
+    only up to `max_bytes`. A 304 answer to a conditional request is returned
+    with an empty body."""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 4,
+        dns_ttl: int = 300,
+        max_bytes: int = 2 * 1024 * 1024,
+        timeout: float = 5,
+        allowed_content_types=ALLOWED_CONTENT_TYPES,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.max_bytes = max_bytes
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.allowed_content_types = allowed_content_types
+        self._session: aiohttp.ClientSession | None = None
+
+        self.requests = 0
+        self.not_modified = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.errors = 0
+        self.bytes_read = 0
+
+    async def warmup(self) -> None:
+        self.session()
+
+    async def shutdown(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "skipped": self.skipped,
+            "truncated": self.truncated,
+            "errors": self.errors,
+            "bytes_read": self.bytes_read,
+        }
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        return self._session
+
+    async def get(self, url: str, headers: dict | None = None) -> FetchedPage | None:
+        """GETs a page. Returns None on errors and on disallowed content types."""
+
+        return await self._request("GET", url, headers, self.allowed_content_types)
+
+    async def post(self, url: str, headers: dict | None = None) -> FetchedPage | None:
+        return await self._request("POST", url, headers, ("application/json",))
+
+    async def _request(
+        self, method: str, url: str, headers: dict | None, content_types
+    ) -> FetchedPage | None:
+        self.requests += 1
+        try:
+            async with self.session().request(method, url, headers=headers) as response:
+                if response.status == 304:
+                    self.not_modified += 1
+                    return self._page(url, response, "")
+                if not response.content_type.startswith(content_types):
+                    self.skipped += 1
+                    return None
+
+                body, truncated = await self._read(response)
+                try:
+                    text = body.decode(response.charset or "utf-8", errors="replace")
+                except LookupError:
+                    # Unknown charset in the Content-Type header.
+                    text = body.decode("utf-8", errors="replace")
+                return self._page(url, response, text, truncated)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            logger.info(f"FETCH FAILED: {url} {e!r}")
+            return None
+
+    def _page(
+        self,
+        url: str,
+        response: aiohttp.ClientResponse,
+        body: str,
+        truncated: bool = False,
+    ) -> FetchedPage:
+        return FetchedPage(
+            url=url,
+            status=response.status,
+            content_type=response.content_type,
+            body=body,
+            truncated=truncated,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+    async def _read(self, response: aiohttp.ClientResponse) -> tuple[bytes, bool]:
+        """Reads the body up to max_bytes, dropping the connection past the cap."""
+
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body.extend(chunk)
+            if len(body) >= self.max_bytes:
+                response.close()
+                self.truncated += 1
+                self.bytes_read += self.max_bytes
+                return bytes(body[: self.max_bytes]), True
+        self.bytes_read += len(body)
+        return bytes(body), False
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import time
+from models.page import CachedPage
+from util import Component
+
+
+class PageCache(Component):
+    """In-process cache of the text extracted from each URL.
+
+    Pages validated less than `fresh_for` seconds ago are served as they are.
+    Older pages are revalidated with their ETag/Last-Modified, so an unchanged
+    page is neither downloaded nor parsed again. Pages not validated for `ttl`
+    seconds are dropped, and the least recently used ones are evicted once the
+    text held exceeds `max_bytes`."""
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: float = 24 * 3600,
+        fresh_for: float = 300,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.fresh_for = fresh_for
+
+        self._pages: OrderedDict[str, CachedPage] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.stored = 0
+        self.evictions = 0
+
+    async def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "stored": self.stored,
+            "evictions": self.evictions,
+            "entries": len(self._pages),
+            "bytes": self._bytes,
+        }
+
+    def lookup(self, url: str) -> tuple[CachedPage | None, bool]:
+        """Returns the cached page, if any, and whether it can be served as is."""
+
+        page = self._pages.get(url)
+        if page is None:
+            return None, False
+        now = time.time()
+        if now - page.validated_at > self.ttl:
+            self._drop(url)
+            return None, False
+
+        self._pages.move_to_end(url)
+        fresh = now - page.validated_at <= self.fresh_for
+        if fresh:
+            self.hits += 1
+        return page, fresh
+
+    def revalidated(self, url: str) -> None:
+        """Marks a page the origin confirmed unchanged as fresh again."""
+
+        if url in self._pages:
+            self._pages[url].validated_at = time.time()
+            self.revalidations += 1
+
+    def store(
+        self,
+        url: str,
+        text: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        if url in self._pages:
+            self._drop(url)
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        self._pages[url] = CachedPage(
+            url=url,
+            text=text,
+            size=size,
+            etag=etag,
+            last_modified=last_modified,
+            stored_at=now,
+            validated_at=now,
+        )
+        self._bytes += size
+        self.stored += 1
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._pages)))
+            self.evictions += 1
+
+    def _drop(self, url: str) -> None:
+        self._bytes -= self._pages.pop(url).size
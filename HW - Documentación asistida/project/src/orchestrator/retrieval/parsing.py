@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
+from util import Component
+from util.html import extract_text
+
+
+class HtmlParser(Component):
+    """Extracts text from HTML away from the event loop.
+
+    Pages of at least `inline_below` characters are parsed in a pool of
+    `workers` processes, with at most `max_pending` parses queued or running;
+    smaller pages are cheaper to parse inline than to ship to a worker. With
+    workers=0 every page is parsed inline."""
+
+    def __init__(
+        self,
+        backend: str = "html.parser",
+        workers: int = 2,
+        max_pending: int = 32,
+        inline_below: int = 16 * 1024,
+    ) -> None:
+        self.backend = backend
+        self.workers = workers
+        self.inline_below = inline_below
+        self._pending = asyncio.Semaphore(max_pending)
+        self._executor: ProcessPoolExecutor | None = None
+        self.inline = 0
+        self.offloaded = 0
+
+    async def warmup(self) -> None:
+        extract_text("<p></p>", self.backend)
+        if self.workers and self._executor is None:
+            # spawn keeps workers clear of the event loop state a fork would copy.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    async def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def stats(self) -> dict:
+        return {"inline": self.inline, "offloaded": self.offloaded}
+
+    async def parse(self, body: str) -> str:
+        if not self.workers or len(body) < self.inline_below:
+            self.inline += 1
+            return extract_text(body, self.backend)
+
+        if self._executor is None:
+            await self.warmup()
+        async with self._pending:
+            self.offloaded += 1
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(extract_text, body, self.backend)
+            )
@@ -0,0 +1,123 @@
+from abc import ABC, abstractmethod
+from typing import Literal
+import numpy as np
+from retrieval.similarity import normalize, to_matrix
+
+VectorType = Literal["FLOAT32", "FLOAT16"]
+NUMPY_DTYPES = {"FLOAT32": np.float32, "FLOAT16": np.float16}
+
+
+class VectorReducer(ABC):
+    """Maps embeddings to fewer dimensions, preserving cosine similarity.
+
+    A reducer must be fitted once and then used unchanged for every stored and
+    every query vector, so it is saved next to the cache it belongs to."""
+
+    kind: str
+
+    def __init__(self, input_dimension: int, output_dimension: int) -> None:
+        if output_dimension > input_dimension:
+            raise ValueError("A reducer cannot add dimensions")
+        self.input_dimension = input_dimension
+        self.output_dimension = output_dimension
+
+    @abstractmethod
+    def fit(self, vectors) -> "VectorReducer":
+        pass
+
+    @abstractmethod
+    def _project(self, matrix: np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def _state(self) -> dict[str, np.ndarray]:
+        pass
+
+    def transform(self, vectors) -> np.ndarray:
+        """Reduced, L2-normalized float32 rows."""
+
+        return normalize(self._project(normalize(to_matrix(vectors))))
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            kind=self.kind,
+            dimensions=[self.input_dimension, self.output_dimension],
+            **self._state(),
+        )
+
+
+class PCAReducer(VectorReducer):
+    """Keeps the principal components of a sample of the cached embeddings."""
+
+    kind = "pca"
+
+    def __init__(self, input_dimension: int, output_dimension: int) -> None:
+        super().__init__(input_dimension, output_dimension)
+        self.mean: np.ndarray | None = None
+        self.components: np.ndarray | None = None
+
+    def fit(self, vectors) -> "PCAReducer":
+        matrix = normalize(to_matrix(vectors))
+        if len(matrix) < self.output_dimension:
+            raise ValueError("PCA needs at least as many samples as output dimensions")
+        self.mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - self.mean, full_matrices=False)
+        self.components = vt[: self.output_dimension].T.astype(np.float32)
+        return self
+
+    def _project(self, matrix: np.ndarray) -> np.ndarray:
+        if self.components is None:
+            raise RuntimeError("PCAReducer used before fit()")
+        return (matrix - self.mean) @ self.components
+
+    def _state(self) -> dict[str, np.ndarray]:
+        return {"mean": self.mean, "components": self.components}  # type: ignore
+
+
+class RandomProjectionReducer(VectorReducer):
+    """Gaussian random projection. Needs no sample, only a seed."""
+
+    kind = "random"
+
+    def __init__(self, input_dimension: int, output_dimension: int, seed: int = 0):
+        super().__init__(input_dimension, output_dimension)
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal(
+            (input_dimension, output_dimension), dtype=np.float32
+        ) / np.sqrt(output_dimension)
+
+    def fit(self, vectors) -> "RandomProjectionReducer":
+        return self
+
+    def _project(self, matrix: np.ndarray) -> np.ndarray:
+        return matrix @ self.projection
+
+    def _state(self) -> dict[str, np.ndarray]:
+        return {"seed": np.array(self.seed)}
+
+
+def load_reducer(path: str) -> VectorReducer:
+    state = np.load(path)
+    input_dimension, output_dimension = state["dimensions"].tolist()
+    kind = str(state["kind"])
+    if kind == "random":
+        return RandomProjectionReducer(
+            input_dimension, output_dimension, int(state["seed"])
+        )
+    if kind == "pca":
+        reducer = PCAReducer(input_dimension, output_dimension)
+        reducer.mean = state["mean"]
+        reducer.components = state["components"]
+        return reducer
+    raise ValueError(f"Unknown reducer kind '{kind}'")
+
+
+def compress(
+    vectors, reducer: VectorReducer | None = None, dtype: VectorType = "FLOAT32"
+) -> np.ndarray:
+    """Vectors as the cache stores and queries them."""
+
+    matrix = to_matrix(vectors) if reducer is None else reducer.transform(vectors)
+    return matrix.astype(NUMPY_DTYPES[dtype])
@@ -1,9 +1,7 @@
 import asyncio
 import json
 import time
-from typing import Any, AsyncGenerator
-import numpy as np
-import pandas as pd
+from typing import AsyncGenerator
 from util import logger
 from models.document import Document
 from retrieval.search import Searcher
@@ -11,7 +9,7 @@ from retrieval.cache import VectorDbCache
 from retrieval.splitter import Splitter
 from retrieval.scraper import Scraper
 from retrieval.embeddings import Embeddings
-from sklearn.metrics.pairwise import cosine_similarity
+from retrieval.similarity import cosine_scores, normalize, to_matrix, top_k
 from models.search import SearchDoc, SearchResult
 
 
@@ -23,25 +21,49 @@ class Retriever:
         scraper: Scraper,
         embeddings: Embeddings,
         splitter: Splitter,
+        deadline: float | None = None,
+        good_chunk_threshold: float | None = None,
+        min_good_chunks: int | None = None,
+        embedding_batch_size: int = 64,
+        partial_hit_threshold: float | None = None,
     ) -> None:
         self.cache = cache
         self.searcher = searcher
         self.scraper = scraper
         self.embeddings = embeddings
         self.splitter = splitter
+        # Seconds a web search may spend scraping and embedding before it stops.
+        self.deadline = deadline
+        # Chunks at least this similar to the query count as good; reaching
+        # min_good_chunks of them (k by default) stops the search early.
+        self.good_chunk_threshold = good_chunk_threshold
+        self.min_good_chunks = min_good_chunks
+        self.embedding_batch_size = embedding_batch_size
+        # When the cache as a whole is not good enough, cached chunks at least
+        # this similar to the query are still kept and only the rest is searched.
+        self.partial_hit_threshold = partial_hit_threshold
 
     async def get_context(
-        self, query: str, cache_treshold: float = 0.85, k: int = 10
+        self,
+        query: str,
+        cache_treshold: float = 0.85,
+        k: int = 10,
+        query_vector: list[float] | None = None,
     ) -> AsyncGenerator[dict, None]:
-        """Generates context based on query. It can retrieve from cache or from internet."""
+        """Generates context based on query. It can retrieve from cache or from internet.
+
+        The documents behind the context come in a "sources" event right before
+        it, which is not meant to be streamed to the client."""
 
-        query_vector = await self.embeddings.run([query])
-        documents = await self.cache.find_similar(query_vector[0], k)
+        if query_vector is None:
+            query_vector = (await self.embeddings.run([query]))[0]
+        documents = await self.cache.find_similar(query_vector, k)
         quality_cache = await self.evaluate_retrieval(documents, cache_treshold)
 
         logger.info(f"QUALITY CACHE: {quality_cache}")
 
         if quality_cache:
+            self.cache.record_lookup("hit")
             search_results = SearchResult(
                 items=[SearchDoc(link=doc.url) for doc in documents]
             )
@@ -51,47 +73,167 @@ class Retriever:
         yield {"event": "search", "data": json.dumps(search_results.model_dump())}
 
         if not quality_cache:
-            documents = await self.search_for_documents(search_results, query_vector, k)
-            await self.cache.write(documents)
+            # Pages already in the cache are not scraped and embedded again.
+            cached_urls = await self.cache.cached_urls(
+                [item.link for item in search_results.items]
+            )
+            kept = self._partial_hits(documents)
+            self.cache.record_lookup("partial" if kept else "miss")
+            if kept:
+                kept += await self._cached_pages(query_vector, kept, cached_urls, k)
+                cached_urls |= {doc.url for doc in documents}
+                new_documents = await self.top_up(
+                    search_results, query_vector, kept, cached_urls, k
+                )
+            else:
+                kept = await self.cache.find_similar(query_vector, k, urls=cached_urls)
+                logger.info(f"CACHED PAGES REUSED: {len(cached_urls)}")
+                uncached = SearchResult(
+                    items=[
+                        item
+                        for item in search_results.items
+                        if item.link not in cached_urls
+                    ]
+                )
+                new_documents = await self.search_for_documents(
+                    uncached, query_vector, k
+                )
+            documents = sorted(
+                kept + new_documents, key=lambda doc: doc.similarity, reverse=True
+            )[:k]
+            await self.cache.write(new_documents)
 
+        # Not for the client: tells the caller which chunks the context holds.
+        yield {"event": "sources", "data": documents}
         context = "\n".join([doc.text for doc in documents])
         yield {"event": "context", "data": context}
 
+    def _partial_hits(self, documents: list[Document]) -> list[Document]:
+        if self.partial_hit_threshold is None:
+            return []
+        return [
+            doc for doc in documents if doc.similarity >= self.partial_hit_threshold
+        ]
+
+    async def _cached_pages(
+        self, query_vector, kept: list[Document], cached_urls: set[str], k: int
+    ) -> list[Document]:
+        """Best chunks of the cached result pages other than the kept ones', for
+        the places the kept chunks leave free, as those pages are not fetched."""
+
+        missing = k - len(kept)
+        urls = cached_urls - {doc.url for doc in kept}
+        if missing <= 0 or not urls:
+            return []
+
+        texts = {doc.text for doc in kept}
+        found = await self.cache.find_similar(query_vector, missing, urls=urls)
+        return [doc for doc in found if doc.text not in texts]
+
+    async def top_up(
+        self,
+        search_results: SearchResult,
+        query_vector,
+        kept: list[Document],
+        cached_urls: set[str],
+        k: int,
+    ) -> list[Document]:
+        """Searches only for the chunks missing next to the kept cached ones.
+
+        Links whose page is already cached are skipped, and at most one new page
+        is fetched per missing chunk."""
+
+        missing = k - len(kept)
+        if missing <= 0:
+            return []
+
+        items = [item for item in search_results.items if item.link not in cached_urls]
+        items = items[:missing]
+        logger.info(f"PARTIAL CACHE HIT: {len(kept)} kept, {len(items)} pages to fetch")
+        return await self.search_for_documents(
+            SearchResult(items=items), query_vector, missing
+        )
+
     async def search_for_documents(
         self, search_results, query_vector, k
     ) -> list[Document]:
-        """Searches for relevant information on the internet."""
+        """Searches for relevant information on the internet.
+
+        Every page is split and embedded as soon as it arrives, with embedding
+        batches running concurrently. The search stops at the deadline, or once
+        enough chunks are similar to the query."""
 
         start = time.perf_counter()
+        deadline = None if self.deadline is None else start + self.deadline
+        enough = self.min_good_chunks or k
 
         results = search_results.model_dump()
-        tasks = [self.scraper.fetch(item["link"]) for item in results["items"]]
-        pages = await asyncio.gather(*tasks)
-
-        end = time.perf_counter()
-        logger.info(f"SCRAPE TIME: {end - start}")
+        fetches = {
+            asyncio.create_task(self.scraper.fetch(item["link"]))
+            for item in results["items"]
+        }
+        pending = set(fetches)
 
         documents = []
         page_count = 0
-        for page in pages:
-            if page["text"]:
-                page_count += 1
-                splits = await self.splitter.split(page["text"])
-                for split in splits:
-                    documents.append({"text": split, "url": page["url"]})
+        split_count = 0
+        good_count = 0
+        embedding_start_time = None
+        embedding_end_time = None
 
-        logger.info(f"SCRAPED PAGES: {page_count}")
-        logger.info(f"SPLIT COUNT: {len(documents)}")
+        try:
+            while pending:
+                timeout = None
+                if deadline is not None:
+                    timeout = max(deadline - time.perf_counter(), 0)
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info(f"SEARCH DEADLINE REACHED: {self.deadline}")
+                    break
+
+                for task in done:
+                    if task in fetches:
+                        fetches.discard(task)
+                        if not fetches:
+                            logger.info(f"SCRAPE TIME: {time.perf_counter() - start}")
 
-        embedding_start_time = time.perf_counter()
-        texts = [doc["text"] for doc in documents]
-        embeddings = await self.embeddings.run(texts)
+                        page = self._page_from(task)
+                        if not page or not page["text"]:
+                            continue
 
-        for i, vector in enumerate(embeddings):
-            documents[i]["vector"] = vector
+                        page_count += 1
+                        splits = await self.splitter.split(page["text"])
+                        split_count += len(splits)
+                        if embedding_start_time is None:
+                            embedding_start_time = time.perf_counter()
+                        for i in range(0, len(splits), self.embedding_batch_size):
+                            batch = splits[i : i + self.embedding_batch_size]
+                            pending.add(
+                                asyncio.create_task(
+                                    self.embed_split(page["url"], batch)
+                                )
+                            )
+                    else:
+                        embedded = task.result()
+                        documents.extend(embedded)
+                        embedding_end_time = time.perf_counter()
+                        good_count += self._count_good(query_vector, embedded)
 
-        embedding_time = time.perf_counter() - embedding_start_time
-        logger.info(f"EMBEDDING TIME: {embedding_time}")
+                if good_count >= enough and self.good_chunk_threshold is not None:
+                    logger.info(f"ENOUGH GOOD CHUNKS: {good_count}")
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if fetches:
+            logger.info(f"SCRAPE TIME: {time.perf_counter() - start}")
+        logger.info(f"SCRAPED PAGES: {page_count}")
+        logger.info(f"SPLIT COUNT: {split_count}")
+        if embedding_start_time is not None and embedding_end_time is not None:
+            logger.info(f"EMBEDDING TIME: {embedding_end_time - embedding_start_time}")
 
         relevant_documents = await self.get_most_similar(query_vector, documents, k)
         mean_score = await self.get_mean_similarity(relevant_documents)
@@ -99,23 +241,47 @@ class Retriever:
         logger.info(f"RETRIEVAL SCORE: {mean_score}")
         return relevant_documents
 
-    async def get_most_similar(self, query_vector, data, k=5) -> list[Document]:
-        """Get most relevant texts based on cosine similarity"""
+    async def embed_split(self, url: str, texts: list[str]) -> list[dict]:
+        """Embeds one batch of splits of a page."""
+
+        vectors = await self.embeddings.run(texts)
+        return [
+            {"text": text, "url": url, "vector": vector}
+            for text, vector in zip(texts, vectors)
+        ]
+
+    def _page_from(self, task: asyncio.Task) -> dict | None:
+        try:
+            return task.result()
+        except Exception as e:
+            logger.info(f"SCRAPE FAILED: {e!r}")
+            return None
 
-        query_vector = np.array(query_vector).reshape(1, -1)
+    def _count_good(self, query_vector, documents: list[dict]) -> int:
+        if self.good_chunk_threshold is None or not documents:
+            return 0
+        matrix = normalize(to_matrix([doc["vector"] for doc in documents]))
+        scores = cosine_scores(query_vector, matrix)
+        return int((scores >= self.good_chunk_threshold).sum())
 
-        def compute_cosine_similarity(row):
-            return cosine_similarity(query_vector, row)[0][0]
+    async def get_most_similar(self, query_vector, data, k=5) -> list[Document]:
+        """Get most relevant texts based on cosine similarity"""
 
-        df: Any = pd.DataFrame(data)
-        df["vector"] = df["vector"].apply(lambda x: np.array(x).reshape(1, -1))
-        df["similarity"] = df["vector"].apply(compute_cosine_similarity)
-        similar = df.nlargest(k, "similarity")[["text", "url", "vector", "similarity"]]
-        similar["vector"] = similar["vector"].apply(lambda x: x[0].tolist())
+        if not data:
+            return []
 
-        json_docs = similar.to_dict("records")
+        matrix = normalize(to_matrix([doc["vector"] for doc in data]))
+        scores = cosine_scores(query_vector, matrix)
 
-        return [Document(**json_doc) for json_doc in json_docs]
+        return [
+            Document(
+                text=data[i]["text"],
+                url=data[i]["url"],
+                vector=data[i]["vector"],
+                similarity=float(scores[i]),
+            )
+            for i in top_k(scores, k)
+        ]
 
     async def evaluate_retrieval(
         self, documents: list[Document], treshold: float
@@ -1,48 +1,125 @@
 from abc import ABC, abstractmethod
-import re
+import json
 from typing import Any
+from urllib.parse import urlencode
 
-import aiohttp
-from bs4 import BeautifulSoup
+from models.page import CachedPage, FetchedPage
+from retrieval.fetcher import FetchEngine
+from retrieval.page_cache import PageCache
+from retrieval.parsing import HtmlParser
+from util import Component
 
 
-class Scraper(ABC):
-    @abstractmethod
+class Scraper(Component, ABC):
+    def __init__(
+        self,
+        engine: FetchEngine | None = None,
+        parser: HtmlParser | None = None,
+        pages: PageCache | None = None,
+    ) -> None:
+        # Dependencies that are not passed in are owned, and shut down, here.
+        self._owned: list[Component] = []
+        if engine is None:
+            engine = self.default_engine()
+            self._owned.append(engine)
+        if parser is None:
+            parser = HtmlParser(workers=0)
+            self._owned.append(parser)
+        self.engine = engine
+        self.parser = parser
+        # Without a page cache every fetch downloads and parses the page.
+        self.pages = pages
+
+    def default_engine(self) -> FetchEngine:
+        return FetchEngine()
+
+    async def warmup(self) -> None:
+        for component in self._owned:
+            await component.warmup()
+
+    async def shutdown(self) -> None:
+        for component in self._owned:
+            await component.shutdown()
+
     async def fetch(self, url: str) -> dict[str, Any]:
+        cached, fresh = None, False
+        if self.pages is not None:
+            cached, fresh = self.pages.lookup(url)
+        if cached is not None and fresh:
+            return {"url": url, "text": cached.text}
+
+        page = await self.download(url, cached)
+        if page is None:
+            return {"url": url, "text": None}
+        if page.status == 304 and cached is not None:
+            self.pages.revalidated(url)  # type: ignore
+            return {"url": url, "text": cached.text}
+
+        text = await self.parse(page.body)
+        if text and self.pages is not None and page.status == 200:
+            self.pages.store(url, text, page.etag, page.last_modified)
+        return {"url": url, "text": text or None}
+
+    @abstractmethod
+    async def download(self, url: str, cached: CachedPage | None) -> FetchedPage | None:
+        """Gets the page, conditionally on the cached copy if there is one."""
         pass
 
     async def parse(self, body):
         """Parses all the text from the html."""
 
-        soup = BeautifulSoup(body, "html.parser")
-        raw_text = soup.get_text(separator=" ", strip=True)
-        text = re.sub(r"\n{3,}|\s{2,}", "\n", raw_text)
-        return text
+        return await self.parser.parse(body)
 
 
 class ScraperRemote(Scraper):
-    def __init__(self, host: str = "http://lb-scraper/scrape/?url=") -> None:
+    """Scrapes through the lb-scraper service, which may render pages in a browser.
+
+    The service queues requests for a browser, so it gets an engine of its own
+    with a longer timeout and more connections than the one shared for direct
+    page fetches."""
+
+    def __init__(
+        self,
+        host: str = "http://lb-scraper/scrape/?url=",
+        engine: FetchEngine | None = None,
+        parser: HtmlParser | None = None,
+        pages: PageCache | None = None,
+    ) -> None:
+        super().__init__(engine, parser, pages)
         self.host = host
 
-    async def fetch(self, url: str) -> dict[str, Any]:
-        async with aiohttp.ClientSession() as session:
-            query_url = self.host + url
-            async with session.post(query_url) as response:
-                if response.status == 200:
-                    body = await response.json()
-                    text = await self.parse(body["html"])
-                    if text:
-                        return {"url": url, "text": text}
-            return {"url": url, "text": None}
+    def default_engine(self) -> FetchEngine:
+        # Up to 3 s of plain HTTP, 10 s waiting for a browser and 2 s of page load.
+        return FetchEngine(limit_per_host=32, timeout=20, max_bytes=8 * 1024 * 1024)
+
+    async def download(self, url: str, cached: CachedPage | None) -> FetchedPage | None:
+        endpoint = self.host + url
+        if cached is not None:
+            validators = {"etag": cached.etag, "last_modified": cached.last_modified}
+            validators = {k: v for k, v in validators.items() if v}
+            if validators:
+                endpoint += "&" + urlencode(validators)
+
+        response = await self.engine.post(endpoint)
+        # A truncated JSON payload cannot be decoded, so it counts as a miss.
+        if response is None or response.status != 200 or response.truncated:
+            return None
+        body = json.loads(response.body)
+        return FetchedPage(
+            url=url,
+            status=304 if body.get("not_modified") else 200,
+            content_type="text/html",
+            body=body.get("html") or "",
+            etag=body.get("etag"),
+            last_modified=body.get("last_modified"),
+        )
 
 
 class ScraperLocal(Scraper):
-    async def fetch(self, url):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url, timeout=aiohttp.ClientTimeout(total=5)
-            ) as response:
-                html = await response.text()
-                text = await self.parse(html)
-
-                return {"url": url, "text": text}
+    async def download(self, url: str, cached: CachedPage | None) -> FetchedPage | None:
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return await self.engine.get(url, headers or None)
@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
 import os
+import time
 from urllib.parse import urlencode
 from models.search import SearchResult
 import aiohttp
+from util import Component
 
 from mocks.test_dict import provisional_search_result
 
@@ -16,9 +20,11 @@ REQUEST_HEADERS = {
     "Accept-Encoding": HEADER_ACCEPT_ENCODING,
     "User-Agent": HEADER_USER_AGENT,
 }
+# Returned when the API answer cannot be used. Never cached.
+PROVISIONAL_RESULT = SearchResult(**provisional_search_result)
 
 
-class Searcher(ABC):
+class Searcher(Component, ABC):
     @abstractmethod
     async def run(self, query: str) -> SearchResult:
         pass
@@ -27,6 +33,20 @@ class Searcher(ABC):
 class GoogleAPI(Searcher):
     def __init__(self) -> None:
         super().__init__()
+        self._session: aiohttp.ClientSession | None = None
+
+    async def warmup(self) -> None:
+        self.session()
+
+    async def shutdown(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers=REQUEST_HEADERS)
+        return self._session
 
     async def run(self, query: str) -> SearchResult:
         query_params = urlencode(
@@ -39,14 +59,77 @@ class GoogleAPI(Searcher):
         )
         url = f"{GOOGLE_API_URL}{query_params}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers=REQUEST_HEADERS,
-            ) as response:
-                r = await response.json()
-                try:
-                    return SearchResult(**r)
-                except Exception as e:
-                    print("SEARCHER", e)
-                    return SearchResult(**provisional_search_result)
+        async with self.session().get(url) as response:
+            r = await response.json()
+            try:
+                return SearchResult(**r)
+            except Exception as e:
+                print("SEARCHER", e)
+                return PROVISIONAL_RESULT
+
+
+class CachedSearcher(Searcher):
+    """Searcher wrapper that caches results by normalized query.
+
+    Queries that only differ in case and whitespace share an entry. Entries
+    live for `ttl` seconds and the least recently used ones are evicted past
+    `max_entries`. Concurrent searches for the same query wait on a single
+    upstream call instead of each making their own."""
+
+    def __init__(
+        self, searcher: Searcher, ttl: float = 3600, max_entries: int = 10_000
+    ) -> None:
+        self.searcher = searcher
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._results: OrderedDict[str, tuple[float, SearchResult]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def warmup(self) -> None:
+        await self.searcher.warmup()
+
+    async def shutdown(self) -> None:
+        await self.searcher.shutdown()
+
+    async def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._results),
+        }
+
+    async def run(self, query: str) -> SearchResult:
+        key = " ".join(query.casefold().split())
+        cached = self._results.get(key)
+        if cached is not None:
+            if time.monotonic() - cached[0] <= self.ttl:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(self._search(key, query))
+            self._in_flight[key] = task
+        # A caller that gives up must not cancel the search for the others.
+        return await asyncio.shield(task)
+
+    async def _search(self, key: str, query: str) -> SearchResult:
+        try:
+            result = await self.searcher.run(query)
+        finally:
+            del self._in_flight[key]
+        if result is not PROVISIONAL_RESULT:
+            self._results[key] = (time.monotonic(), result)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
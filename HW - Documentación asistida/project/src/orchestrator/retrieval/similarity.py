@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def to_matrix(vectors) -> np.ndarray:
+    """Stacks a list of vectors into a single float32 matrix."""
+
+    return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalizes every row. Zero rows are left as zeros."""
+
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def cosine_scores(query_vector, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one query against every row of an already normalized matrix."""
+
+    query = normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))
+    return matrix @ query[0]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first. Ties keep input order."""
+
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        # Every score tied with the k-th competes for the last places, not only
+        # the ones argpartition happened to pick.
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
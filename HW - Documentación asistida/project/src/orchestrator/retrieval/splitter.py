@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import numpy as np
 import spacy
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from util import Component
+from util.nlp import SENTENCE_COMPONENTS, load_pipeline, sentence_batch
 
 
-class Splitter(ABC):
+class Splitter(Component, ABC):
     @abstractmethod
     async def split(self, text: str) -> list[str]:
         pass
@@ -15,9 +20,7 @@ class LangChainSplitter(Splitter):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.length_function = length_function
-
-    async def split(self, text: str) -> list[str]:
-        text_splitter = RecursiveCharacterTextSplitter(
+        self.text_splitter = RecursiveCharacterTextSplitter(
             # Set a really small chunk size, just to show.
             separators=["\n\n", "\n", " ", ""],
             chunk_size=self.chunk_size,
@@ -25,73 +28,187 @@ class LangChainSplitter(Splitter):
             length_function=self.length_function,
             # is_separator_regex=False,
         )
-        chunks = text_splitter.split_text(text)
-
-        return chunks
 
+    async def split(self, text: str) -> list[str]:
+        chunks = self.text_splitter.split_text(text)
 
-nlp = spacy.load("en_core_web_sm")
+        return chunks
 
 
 class AdjSenSplitter(Splitter):
-    def __init__(self) -> None:
-        pass
+    """Splits text into runs of adjacent, similar sentences.
+
+    `split` handles one text on the event loop, with the full `model` loaded the
+    first time it runs. `split_many` sends a whole set
+    of pages through `nlp.pipe` in `workers` processes, each loading `model`
+    with only `components` enabled, and re-clusters oversized clusters from the
+    sentence vectors it already has. With workers=0 the pipeline runs in a
+    thread of this process."""
+
+    def __init__(
+        self,
+        model: str = "en_core_web_sm",
+        workers: int = 2,
+        batch_size: int = 16,
+        components=SENTENCE_COMPONENTS,
+    ) -> None:
+        self.model = model
+        self.workers = workers
+        self.batch_size = batch_size
+        self.components = components
+        self._executor: ProcessPoolExecutor | None = None
+        self._pipeline_loaded = False
+        self._nlp = None
+        self._loading = asyncio.Lock()
+
+    async def warmup(self) -> None:
+        if self.workers and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_pipeline,
+                initargs=(self.model, self.components),
+            )
+            # Start the workers, and load their models, before the first request.
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._executor, sentence_batch, ["Warmup."])
+                    for _ in range(self.workers)
+                )
+            )
+        elif not self.workers and not self._pipeline_loaded:
+            await asyncio.to_thread(load_pipeline, self.model, self.components)
+            self._pipeline_loaded = True
+
+    async def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     async def process(self, text):
-        # Load the Spacy model
-        doc = nlp(text)
+        async with self._loading:
+            if self._nlp is None:
+                self._nlp = await asyncio.to_thread(spacy.load, self.model)
+        doc = self._nlp(text)
         sents = list(doc.sents)
         vecs = np.stack([sent.vector / sent.vector_norm for sent in sents])  # type: ignore
 
         return sents, vecs
 
     async def cluster_text(self, sents, vecs, threshold):
-        clusters = [[0]]
-        for i in range(1, len(sents)):
-            if np.dot(vecs[i], vecs[i - 1]) < threshold:
-                clusters.append([])
-            clusters[-1].append(i)
-
-        return clusters
+        bounds = self._boundaries(vecs, threshold)
+        return [list(range(s, e)) for s, e in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def _boundaries(vecs, threshold) -> np.ndarray:
+        """Start of every cluster of adjacent similar sentences, then the end."""
+
+        similarities = np.einsum("ij,ij->i", vecs[1:], vecs[:-1])
+        breaks = np.flatnonzero(similarities < threshold) + 1
+        return np.concatenate(([0], breaks, [len(vecs)]))
+
+    def _segments(self, sents: list[str], vecs, threshold):
+        """Start, end and joined length in characters of every cluster."""
+
+        bounds = self._boundaries(vecs, threshold)
+        starts, ends = bounds[:-1], bounds[1:]
+        # Offset of each sentence in the texts joined with single spaces.
+        lengths = np.fromiter(map(len, sents), dtype=np.int64, count=len(sents))
+        offsets = np.concatenate(([0], np.cumsum(lengths + 1)))
+        joined = offsets[ends] - offsets[starts] - 1
+        return starts.tolist(), ends.tolist(), joined.tolist()
+
+    def _fitting_texts(self, sents: list[str], vecs, threshold) -> list[str]:
+        """Clusters of 60 to 3000 characters, joined."""
+
+        starts, ends, joined = self._segments(sents, vecs, threshold)
+        return [
+            " ".join(sents[start:end])
+            for start, end, length in zip(starts, ends, joined)
+            if 60 <= length <= 3000
+        ]
 
     async def split(self, text: str, similarity_treshold: float = 0.6):
-        # Initialize the clusters lengths list and final texts list
-        clusters_lens = []
         final_texts = []
 
         # Process the chunk
         threshold = 0.5
         sents, vecs = await self.process(text)
+        texts = [sent.text for sent in sents]
 
-        # Cluster the sentences
-        clusters = await self.cluster_text(sents, vecs, threshold)
-
-        for cluster in clusters:
-            cluster_txt = " ".join([sents[i].text for i in cluster])
-            cluster_len = len(cluster_txt)
-
-            # Check if the cluster is too short
-            if cluster_len < 60:
+        # Cluster the sentences, skipping the ones that are too short
+        for start, end, length in zip(*self._segments(texts, vecs, threshold)):
+            if length < 60:
                 continue
 
+            cluster_txt = " ".join(texts[start:end])
             # Check if the cluster is too long
-            elif cluster_len > 3000:
-                threshold = similarity_treshold
+            if length > 3000:
                 sents_div, vecs_div = await self.process(cluster_txt)
-                reclusters = await self.cluster_text(sents_div, vecs_div, threshold)
+                final_texts.extend(
+                    self._fitting_texts(
+                        [sent.text for sent in sents_div], vecs_div, similarity_treshold
+                    )
+                )
+            else:
+                final_texts.append(cluster_txt)
 
-                for subcluster in reclusters:
-                    div_txt = " ".join([sents_div[i].text for i in subcluster])
-                    div_len = len(div_txt)
+        return final_texts
 
-                    if div_len < 60 or div_len > 3000:
-                        continue
+    async def split_many(
+        self, texts: list[str], similarity_treshold: float = 0.6
+    ) -> list[list[str]]:
+        """Splits every text, processing them all in batches off the event loop."""
+
+        await self.warmup()
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if self._executor is not None:
+            loop = asyncio.get_running_loop()
+            processed = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        self._executor, sentence_batch, batch, self.batch_size
+                    )
+                    for batch in batches
+                )
+            )
+        else:
+            processed = [
+                await asyncio.to_thread(sentence_batch, batch, self.batch_size)
+                for batch in batches
+            ]
+
+        return [
+            self._split_sentences(sents, vecs, similarity_treshold)
+            for batch in processed
+            for sents, vecs in batch
+        ]
+
+    def _split_sentences(
+        self, sents: list[str], vecs: np.ndarray, similarity_treshold: float
+    ) -> list[str]:
+        """Same clustering as `split`, from sentences already parsed."""
+
+        if not sents:
+            return []
 
-                    clusters_lens.append(div_len)
-                    final_texts.append(div_txt)
+        final_texts = []
+        for start, end, length in zip(*self._segments(sents, vecs, 0.5)):
+            if length < 60:
+                continue
 
+            if length > 3000:
+                # Re-cluster with the vectors at hand instead of re-parsing.
+                final_texts.extend(
+                    self._fitting_texts(
+                        sents[start:end], vecs[start:end], similarity_treshold
+                    )
+                )
             else:
-                clusters_lens.append(cluster_len)
-                final_texts.append(cluster_txt)
+                final_texts.append(" ".join(sents[start:end]))
 
         return final_texts
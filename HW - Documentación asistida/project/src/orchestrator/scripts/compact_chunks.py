@@ -0,0 +1,114 @@
+"""Merges duplicate chunks written before chunk keys were content hashes.
+
+Every chunks:* key whose name is not the hash of its text is renamed to that
+hash. When the hashed key already exists, the duplicate is deleted instead and
+the surviving chunk keeps the longer of the two TTLs. Works on JSON and hash
+storage alike.
+
+Run from src/orchestrator:
+    python -m scripts.compact_chunks --host cache --dry-run
+"""
+
+import argparse
+import asyncio
+
+from retrieval.cache import KEY_PREFIX, RedisVectorCache, chunk_key
+
+
+def decoded(value):
+    # The shared connection pool returns bytes.
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+async def texts_of(client, keys: list[str]) -> list[str | None]:
+    pipeline = client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.type(key)
+    types = await pipeline.execute()
+
+    pipeline = client.pipeline(transaction=False)
+    for key, key_type in zip(keys, types):
+        if decoded(key_type) == "hash":
+            pipeline.hget(key, "text")
+        else:
+            pipeline.json().get(key, "$.text")
+    texts = await pipeline.execute()
+    results = []
+    for text in texts:
+        # JSON paths come back as a list of matches.
+        if isinstance(text, list):
+            text = text[0] if text else None
+        results.append(decoded(text))
+    return results
+
+
+async def compact(client, batch_size: int, dry_run: bool) -> dict:
+    stats = {"scanned": 0, "renamed": 0, "merged": 0}
+    batch: list[str] = []
+
+    async def flush() -> None:
+        moves = [
+            (key, chunk_key(text))
+            for key, text in zip(batch, await texts_of(client, batch))
+            if text is not None and chunk_key(text) != key
+        ]
+        stats["scanned"] += len(batch)
+        batch.clear()
+        if not moves:
+            return
+        if dry_run:
+            stats["renamed"] += len(moves)
+            return
+
+        pipeline = client.pipeline(transaction=False)
+        for key, target in moves:
+            pipeline.renamenx(key, target)
+        renamed = await pipeline.execute()
+        duplicates = [move for move, ok in zip(moves, renamed) if not ok]
+        stats["renamed"] += len(moves) - len(duplicates)
+        stats["merged"] += len(duplicates)
+
+        pipeline = client.pipeline(transaction=False)
+        for key, target in duplicates:
+            pipeline.ttl(key)
+            pipeline.ttl(target)
+        ttls = await pipeline.execute()
+
+        pipeline = client.pipeline(transaction=False)
+        for i, (key, target) in enumerate(duplicates):
+            key_ttl, target_ttl = ttls[2 * i], ttls[2 * i + 1]
+            if key_ttl == -1:
+                pipeline.persist(target)
+            elif target_ttl != -1 and key_ttl > target_ttl:
+                pipeline.expire(target, key_ttl)
+            pipeline.delete(key)
+        await pipeline.execute()
+
+    async for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=batch_size):
+        batch.append(decoded(key))
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return stats
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    cache = RedisVectorCache(host=args.host, port=args.port)
+    try:
+        stats = await compact(cache.client, args.batch_size, args.dry_run)
+        action = "Would merge or rename" if args.dry_run else "Compacted"
+        print(f"{action}: {stats}")
+    finally:
+        await cache.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Fits a vector reducer on a sample of the cached chunks and saves it.
+
+The cache must still hold full-dimension vectors. Point CACHE_REDUCER at the
+saved file and refill the cache, whose index then has the reduced dimension.
+
+Run from src/orchestrator:
+    python -m scripts.fit_reducer --host cache --kind pca --output-dimension 256 --output reducer.npz
+"""
+
+import argparse
+import asyncio
+
+import numpy as np
+
+from retrieval.cache import (
+    INDEX_NAME,
+    KEY_PREFIX,
+    RedisVectorCache,
+    storage_type,
+    vector_type,
+)
+from retrieval.reduction import NUMPY_DTYPES, PCAReducer, RandomProjectionReducer
+
+
+async def sample_vectors(cache: RedisVectorCache, samples: int) -> list:
+    info = await cache.client.ft(INDEX_NAME).info()
+    storage = storage_type(info)
+    # Hash vectors are packed in the index dtype.
+    dtype = vector_type(info) if storage == "hash" else "FLOAT32"
+    if dtype not in NUMPY_DTYPES:
+        raise SystemExit(
+            f"Cannot decode hash vectors of an index with data type {dtype}"
+        )
+    keys = []
+    async for key in cache.client.scan_iter(match=f"{KEY_PREFIX}*", count=500):
+        keys.append(key)
+        if len(keys) >= samples:
+            break
+
+    pipeline = cache.client.pipeline(transaction=False)
+    for key in keys:
+        if storage == "hash":
+            pipeline.hget(key, "vector")
+        else:
+            pipeline.json().get(key, "$.vector")
+    vectors = []
+    for raw in await pipeline.execute():
+        if storage == "hash" and raw:
+            vectors.append(np.frombuffer(raw, dtype=NUMPY_DTYPES[dtype]))
+        elif storage == "json" and raw:
+            # JSON paths come back as a list of matches.
+            vectors.append(raw[0])
+    return vectors
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--kind", choices=["pca", "random"], default="pca")
+    parser.add_argument("--output-dimension", type=int, default=256)
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="reducer.npz")
+    args = parser.parse_args()
+
+    cache = RedisVectorCache(host=args.host, port=args.port)
+    try:
+        vectors = await sample_vectors(cache, args.samples)
+    finally:
+        await cache.shutdown()
+    if not vectors:
+        raise SystemExit("No cached vectors to fit a reducer on")
+
+    input_dimension = len(vectors[0])
+    if args.kind == "pca":
+        reducer = PCAReducer(input_dimension, args.output_dimension).fit(vectors)
+    else:
+        reducer = RandomProjectionReducer(
+            input_dimension, args.output_dimension, args.seed
+        )
+    reducer.save(args.output)
+    print(
+        f"Saved {args.kind} reducer {input_dimension} -> {args.output_dimension} "
+        f"fitted on {len(vectors)} vectors to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
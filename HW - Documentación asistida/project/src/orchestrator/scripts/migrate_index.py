@@ -0,0 +1,53 @@
+"""Rebuilds idx:chunks_vss with a new vector index configuration while keeping
+every cached chunk.
+
+Stored vectors are kept as they are, so a new dtype is refused for hash storage,
+whose vectors are packed in the old one. After a dtype change of a JSON cache,
+restart the orchestrator with CACHE_VECTOR_DTYPE set to the new dtype.
+
+Run from src/orchestrator:
+    python -m scripts.migrate_index --host cache --algorithm HNSW --m 16 --ef-construction 200 --ef-runtime 10
+"""
+
+import argparse
+import asyncio
+
+from retrieval.cache import VECTOR_DIMENSION, RedisVectorCache, VectorIndexConfig
+from retrieval.reduction import load_reducer
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--dimension", type=int, default=VECTOR_DIMENSION)
+    parser.add_argument("--algorithm", choices=["FLAT", "HNSW"], default="HNSW")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-runtime", type=int, default=10)
+    parser.add_argument("--dtype", choices=["FLOAT32", "FLOAT16"], default="FLOAT32")
+    parser.add_argument("--reducer", help="reducer the cache was filled with")
+    args = parser.parse_args()
+
+    config = VectorIndexConfig(
+        algorithm=args.algorithm,
+        m=args.m,
+        ef_construction=args.ef_construction,
+        ef_runtime=args.ef_runtime,
+        dtype=args.dtype,
+    )
+    cache = RedisVectorCache(
+        host=args.host,
+        port=args.port,
+        vector_dimension=args.dimension,
+        reducer=load_reducer(args.reducer) if args.reducer else None,
+    )
+    try:
+        target = await cache.migrate_index(config)
+        print(f"idx:chunks_vss now points to {target} ({config})")
+    finally:
+        await cache.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
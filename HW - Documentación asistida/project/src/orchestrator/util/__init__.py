@@ -1 +1,2 @@
 from util.logger import logger
+from util.registry import Component, ComponentRegistry
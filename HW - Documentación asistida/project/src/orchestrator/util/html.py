@@ -0,0 +1,26 @@
+import re
+from bs4 import BeautifulSoup
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+
+def extract_text(body: str, backend: str = "html.parser") -> str:
+    """Parses all the text from the html.
+
+    Kept free of heavy imports so parser worker processes start quickly."""
+
+    if backend == "selectolax":
+        # Optional dependency, only needed when this backend is selected.
+        from selectolax.lexbor import LexborHTMLParser
+
+        tree = LexborHTMLParser(body)
+        tree.strip_tags(["script", "style", "template"])
+        raw_text = tree.text(separator=" ", strip=True)
+    elif backend in PARSER_BACKENDS:
+        soup = BeautifulSoup(body, backend)
+        raw_text = soup.get_text(separator=" ", strip=True)
+    else:
+        raise ValueError(f"Unknown parser backend '{backend}'")
+
+    text = re.sub(r"\n{3,}|\s{2,}", "\n", raw_text)
+    return text
@@ -0,0 +1,29 @@
+import numpy as np
+import spacy
+
+# Sentence boundaries come from the parser and sentence vectors from the
+# tok2vec output, so the tagger, lemmatizer and NER can stay off.
+SENTENCE_COMPONENTS = ("tok2vec", "parser")
+
+_nlp = None
+
+
+def load_pipeline(model: str, components=SENTENCE_COMPONENTS) -> None:
+    """Loads the spaCy model for this process with only `components` enabled."""
+
+    global _nlp
+    _nlp = spacy.load(model, enable=list(components))
+
+
+def sentence_batch(texts: list[str], batch_size: int = 16):
+    """Splits every text into sentences and their L2-normalized vectors."""
+
+    results = []
+    for doc in _nlp.pipe(texts, batch_size=batch_size):  # type: ignore
+        sents = list(doc.sents)
+        if not sents:
+            results.append(([], np.empty((0, 0), dtype=np.float32)))
+            continue
+        vecs = np.stack([sent.vector / sent.vector_norm for sent in sents])
+        results.append(([sent.text for sent in sents], vecs.astype(np.float32)))
+    return results
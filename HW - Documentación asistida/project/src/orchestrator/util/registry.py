@@ -0,0 +1,65 @@
+from typing import TypeVar
+from util.logger import logger
+
+
+class Component:
+    """Base for long-lived components shared across requests."""
+
+    async def warmup(self) -> None:
+        """Prepares the component before it serves the first request."""
+
+    async def shutdown(self) -> None:
+        """Releases the resources held by the component."""
+
+    async def stats(self) -> dict:
+        """Counters worth exposing for tuning. Empty when there are none."""
+
+        return {}
+
+
+C = TypeVar("C", bound=Component)
+
+
+class ComponentRegistry:
+    """Holds the components built at application startup."""
+
+    def __init__(self) -> None:
+        self._components: dict[str, Component] = {}
+
+    def register(self, name: str, component: C) -> C:
+        if name in self._components:
+            raise KeyError(f"Component '{name}' is already registered")
+        self._components[name] = component
+        return component
+
+    def __getitem__(self, name: str) -> Component:
+        return self._components[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._components
+
+    async def startup(self) -> None:
+        """Warms up components in registration order."""
+
+        for name, component in self._components.items():
+            await component.warmup()
+            logger.info(f"COMPONENT READY: {name}")
+
+    async def stats(self) -> dict[str, dict]:
+        """Collects the counters of every component that exposes some."""
+
+        collected = {}
+        for name, component in self._components.items():
+            if stats := await component.stats():
+                collected[name] = stats
+        return collected
+
+    async def shutdown(self) -> None:
+        """Shuts down components in reverse registration order."""
+
+        for name, component in reversed(self._components.items()):
+            try:
+                await component.shutdown()
+            except Exception as e:
+                logger.error(f"COMPONENT SHUTDOWN FAILED: {name} {e!r}")
+        self._components.clear()
@@ -1,50 +1,305 @@
+import asyncio
+import os
+import re
 import time
 from fastapi import FastAPI, HTTPException
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
 from playwright._impl._api_types import TimeoutError
 from contextlib import asynccontextmanager
+from typing import AsyncIterator
 import logging
 import aiohttp
 
 logger = logging.getLogger(__name__)
-app = FastAPI()
 
+# Browser processes kept alive for the lifetime of the service.
+POOL_BROWSERS = int(os.environ.get("SCRAPER_BROWSERS", 1))
+# Pages each browser renders concurrently.
+PAGES_PER_BROWSER = int(os.environ.get("SCRAPER_PAGES_PER_BROWSER", 4))
+# A browser context is thrown away and recreated after this many pages.
+CONTEXT_MAX_USES = int(os.environ.get("SCRAPER_CONTEXT_MAX_USES", 50))
+# Seconds a request waits for a free page before the service gives up.
+QUEUE_TIMEOUT = float(os.environ.get("SCRAPER_QUEUE_TIMEOUT", 10))
+# Try a plain HTTP GET first and only render pages that need JavaScript.
+TIERED_FETCH = os.environ.get("SCRAPER_TIERED_FETCH", "1") == "1"
 
-async def fetch_check_js(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as response:
-            html = await response.text()
+# Below these amounts of visible text, a page is assumed to render client-side.
+JS_MIN_TEXT_CHARS = 200
+JS_MIN_TEXT_RATIO = 0.02
+# "Enable JavaScript" notices only count on pages with little other text.
+JS_MARKER_MAX_TEXT_CHARS = 2000
+JS_MARKERS = (
+    "enable javascript",
+    "javascript is disabled",
+    "javascript is required",
+    "requires javascript",
+    "turn on javascript",
+)
+INVISIBLE = re.compile(
+    r"<(script|style|noscript|template|svg)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL
+)
+TAG = re.compile(r"<[^>]+>")
+NOSCRIPT = re.compile(r"<noscript\b.*?</noscript\s*>", re.IGNORECASE | re.DOTALL)
 
-            # if not "text/javascript" in html:
-            return html
-    return None
 
+class PoolSaturated(Exception):
+    pass
 
-@asynccontextmanager
-async def launch_browser():
-    async with async_playwright() as p:
-        browser = await p.firefox.launch(headless=True)
+
+class _Slot:
+    """One concurrent page of a browser, with the context it reuses."""
+
+    def __init__(self, browser_index: int) -> None:
+        self.browser_index = browser_index
+        self.browser: Browser | None = None
+        self.context: BrowserContext | None = None
+        self.uses = 0
+
+
+class BrowserPool:
+    """Long-lived headless browsers shared by every scrape request.
+
+    Each browser offers a fixed number of slots. A slot keeps its browser
+    context between requests and recycles it after `context_max_uses` pages or
+    after an error; a browser that crashed is relaunched on next use. Requests
+    queue for a free slot for at most `queue_timeout` seconds."""
+
+    def __init__(
+        self,
+        browsers: int = POOL_BROWSERS,
+        pages_per_browser: int = PAGES_PER_BROWSER,
+        context_max_uses: int = CONTEXT_MAX_USES,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ) -> None:
+        self.browsers = browsers
+        self.pages_per_browser = pages_per_browser
+        self.context_max_uses = context_max_uses
+        self.queue_timeout = queue_timeout
+
+        self._playwright = None
+        self._browsers: list[Browser] = []
+        self._slots: asyncio.Queue[_Slot] = asyncio.Queue()
+        self._launch_lock = asyncio.Lock()
+        self.served = 0
+        self.recycled_contexts = 0
+        self.relaunches = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        self._playwright = await async_playwright().start()
+        for i in range(self.browsers):
+            self._browsers.append(await self._launch())
+            for _ in range(self.pages_per_browser):
+                self._slots.put_nowait(_Slot(i))
+
+    async def close(self) -> None:
+        for browser in self._browsers:
+            await browser.close()
+        self._browsers.clear()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self) -> dict:
+        return {
+            "served": self.served,
+            "recycled_contexts": self.recycled_contexts,
+            "relaunches": self.relaunches,
+            "rejected": self.rejected,
+            "free_pages": self._slots.qsize(),
+        }
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        try:
+            slot = await asyncio.wait_for(self._slots.get(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PoolSaturated()
+
+        page = None
+        failed = False
         try:
-            yield browser
+            context = await self._context_for(slot)
+            page = await context.new_page()
+            yield page
+        except TimeoutError:
+            # A slow page says nothing about the health of the context.
+            raise
+        except Exception:
+            failed = True
+            raise
         finally:
-            await browser.close()
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    failed = True
+            slot.uses += 1
+            self.served += 1
+            if failed or slot.uses >= self.context_max_uses:
+                await self._recycle(slot)
+            self._slots.put_nowait(slot)
+
+    async def _launch(self) -> Browser:
+        return await self._playwright.firefox.launch(headless=True)  # type: ignore
+
+    async def _context_for(self, slot: _Slot) -> BrowserContext:
+        browser = self._browsers[slot.browser_index]
+        if not browser.is_connected():
+            async with self._launch_lock:
+                browser = self._browsers[slot.browser_index]
+                if not browser.is_connected():
+                    logger.warning(f"Relaunching browser {slot.browser_index}")
+                    browser = self._browsers[slot.browser_index] = await self._launch()
+                    self.relaunches += 1
+
+        if slot.context is None or slot.browser is not browser:
+            slot.browser = browser
+            slot.context = await browser.new_context()
+            slot.uses = 0
+        return slot.context
+
+    async def _recycle(self, slot: _Slot) -> None:
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+            self.recycled_contexts += 1
+        slot.context = None
+        slot.uses = 0
+
+
+class TierStats:
+    """Requests served and seconds spent per fetch tier."""
+
+    def __init__(self) -> None:
+        self.count = {"http": 0, "browser": 0}
+        self.seconds = {"http": 0.0, "browser": 0.0}
+        self.http_fallbacks = 0
+
+    def record(self, tier: str, seconds: float) -> None:
+        self.count[tier] += 1
+        self.seconds[tier] += seconds
+
+    def stats(self) -> dict:
+        browser_avg = self.seconds["browser"] / max(self.count["browser"], 1)
+        return {
+            "count": self.count,
+            "seconds": self.seconds,
+            "http_fallbacks": self.http_fallbacks,
+            # Browser time the pages served over plain HTTP would have cost.
+            "browser_seconds_saved": self.count["http"] * browser_avg
+            - self.seconds["http"],
+        }
+
+
+pool = BrowserPool()
+tiers = TierStats()
+http_session: aiohttp.ClientSession | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_session
+    http_session = aiohttp.ClientSession()
+    await pool.start()
+    try:
+        yield
+    finally:
+        await pool.close()
+        await http_session.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def needs_javascript(html: str | None) -> bool:
+    """Guesses whether a page only shows useful content once its scripts run."""
+
+    if not html or not html.strip():
+        return True
+
+    noscript = " ".join(NOSCRIPT.findall(html)).lower()
+    text = " ".join(TAG.sub(" ", INVISIBLE.sub(" ", html)).split())
+    if len(text) < JS_MIN_TEXT_CHARS or len(text) / len(html) < JS_MIN_TEXT_RATIO:
+        return True
+
+    if len(text) < JS_MARKER_MAX_TEXT_CHARS:
+        lowered = text.lower() + " " + noscript
+        return any(marker in lowered for marker in JS_MARKERS)
+    return False
+
+
+async def fetch_check_js(url, etag=None, last_modified=None):
+    """Fetches a page over plain HTTP. Returns None if it needs a browser.
+
+    With validators the request is conditional, and an unchanged page comes
+    back as {"not_modified": True} without a body."""
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        async with http_session.get(  # type: ignore
+            url, headers=headers, timeout=aiohttp.ClientTimeout(total=3)
+        ) as response:
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            if response.status == 304 and headers:
+                return {"html": None, "not_modified": True, **validators}
+            if response.status != 200 or "html" not in response.content_type:
+                return None
+            html = await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError):
+        return None
+
+    if needs_javascript(html):
+        return None
+    return {"html": html, "not_modified": False, **validators}
 
 
 async def scrape_with_browser(url: str):
-    async with launch_browser() as browser:
-        page = await browser.new_page()
+    async with pool.page() as page:
         await page.goto(url, timeout=2000)
         html = await page.content()
     return html
 
 
 @app.post("/scrape")
-async def scrape_url(url: str):
+async def scrape_url(
+    url: str,
+    tiered: bool = TIERED_FETCH,
+    etag: str | None = None,
+    last_modified: str | None = None,
+):
+    start = time.perf_counter()
+    if tiered:
+        page = await fetch_check_js(url, etag, last_modified)
+        if page is not None:
+            tiers.record("http", time.perf_counter() - start)
+            return {**page, "tier": "http"}
+        tiers.http_fallbacks += 1
+
+    browser_start = time.perf_counter()
     try:
         html = await scrape_with_browser(url)
     except TimeoutError:
         raise HTTPException(status_code=408, detail="Not fast enough")
-    return {"html": html}
+    except PoolSaturated:
+        raise HTTPException(status_code=503, detail="All browser pages are busy")
+    tiers.record("browser", time.perf_counter() - browser_start)
+    return {"html": html, "tier": "browser"}
+
+
+@app.get("/stats")
+async def stats():
+    return {"pool": pool.stats(), "tiers": tiers.stats()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+import os
+import sys
+from pathlib import Path
+
+# The orchestrator runs from src/orchestrator and imports its packages from there.
+sys.path.insert(0, str(Path(__file__).parent.parent / "src" / "orchestrator"))
+
+# Read at import time by retrieval.search; no test calls the Google API.
+for name in (
+    "GOOGLE_API_HOST",
+    "GOOGLE_API_KEY",
+    "GOOGLE_CX",
+    "GOOGLE_FIELDS",
+    "HEADER_ACCEPT_ENCODING",
+    "HEADER_USER_AGENT",
+):
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,111 @@
+from models.document import Document
+from retrieval import answer_cache
+from retrieval.answer_cache import AnswerCache, normalize_query
+from retrieval.cache import chunk_key
+
+
+class FakeChunkCache:
+    def __init__(self):
+        self.listeners = []
+
+    def on_change(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, keys=(), urls=()):
+        for listener in self.listeners:
+            listener(set(keys), set(urls))
+
+
+def store(cache: AnswerCache, vector, query="question", context="context", url="a"):
+    cache.store(
+        vector,
+        query,
+        search="search",
+        context=context,
+        tokens=["an", "answer"],
+        sources=[Document(url=url, text=context, vector=[], similarity=1)],
+    )
+
+
+def test_near_identical_question_gets_the_stored_answer():
+    cache = AnswerCache(similarity_threshold=0.95)
+    store(cache, [1.0, 0.0, 0.0], query="What is X?")
+
+    answer = cache.lookup([0.99, 0.01, 0.0], "what is  x")
+    assert answer is not None
+    assert answer.tokens == ["an", "answer"]
+    assert cache.lookup([0.0, 1.0, 0.0], "what is x") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_similar_vectors_of_other_questions_are_not_replayed():
+    cache = AnswerCache(similarity_threshold=0.95)
+    store(cache, [1.0, 0.0], query="capital of France")
+
+    assert cache.lookup([1.0, 0.0], "capital of Germany") is None
+    loose = AnswerCache(similarity_threshold=0.95, match_query=False)
+    store(loose, [1.0, 0.0], query="capital of France")
+    assert loose.lookup([1.0, 0.0], "capital of Germany") is not None
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  What's the  capital of France? ") == (
+        "what s the capital of france"
+    )
+
+
+def test_best_match_wins():
+    cache = AnswerCache(similarity_threshold=0.5, match_query=False)
+    store(cache, [1.0, 0.0], context="first")
+    store(cache, [0.8, 0.6], context="second")
+
+    assert cache.lookup([0.7, 0.7], "question").context == "second"  # type: ignore
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    store(cache, [1.0, 0.0])
+
+    now[0] += 59
+    assert cache.lookup([1.0, 0.0], "question") is not None
+    now[0] += 2
+    assert cache.lookup([1.0, 0.0], "question") is None
+    assert cache.evictions == 1
+
+
+def test_answers_survive_new_stores():
+    cache = AnswerCache()
+    store(cache, [1.0, 0.0], query="first", context="kept")
+    store(cache, [0.0, 1.0], query="second")
+
+    assert cache.lookup([1.0, 0.0], "first").context == "kept"  # type: ignore
+
+
+def test_answers_are_dropped_when_their_chunks_change():
+    chunks = FakeChunkCache()
+    cache = AnswerCache(chunks)
+    store(cache, [1.0, 0.0, 0.0], query="a", context="chunk a", url="page-a")
+    store(cache, [0.0, 1.0, 0.0], query="b", context="chunk b", url="page-b")
+    store(cache, [0.0, 0.0, 1.0], query="c", context="chunk c", url="page-c")
+
+    chunks.notify(keys=[chunk_key("chunk a"), chunk_key("unrelated")])
+    chunks.notify(urls=["page-b"])
+
+    assert cache.lookup([1.0, 0.0, 0.0], "a") is None
+    assert cache.lookup([0.0, 1.0, 0.0], "b") is None
+    assert cache.lookup([0.0, 0.0, 1.0], "c") is not None
+    assert cache.invalidations == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    store(cache, [1.0, 0.0, 0.0], query="a", context="a")
+    store(cache, [0.0, 1.0, 0.0], query="b", context="b")
+    cache.lookup([1.0, 0.0, 0.0], "a")
+    store(cache, [0.0, 0.0, 1.0], query="c", context="c")
+
+    assert cache.lookup([0.0, 1.0, 0.0], "b") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "a").context == "a"  # type: ignore
+    assert cache.evictions == 1
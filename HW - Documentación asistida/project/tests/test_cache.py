@@ -0,0 +1,74 @@
+import asyncio
+
+from retrieval.cache import RedisVectorCache, chunk_key, vector_type
+from retrieval.similarity import normalize, to_matrix
+
+
+def test_unique_rows_drops_near_duplicates_greedily():
+    matrix = normalize(
+        to_matrix([[1.0, 0.0], [1.0, 0.01], [0.0, 1.0], [0.01, 1.0], [1.0, 1.0]])
+    )
+    assert RedisVectorCache._unique_rows(matrix) == [0, 2, 4]
+
+
+def test_chunk_key_depends_on_the_text_only():
+    assert chunk_key("same text") == chunk_key("same text")
+    assert chunk_key("same text") != chunk_key("other text")
+    assert chunk_key("x").startswith("chunks:")
+
+
+def test_vector_type_comes_from_the_vector_attribute():
+    text = [b"identifier", b"text", b"attribute", b"text", b"type", b"TEXT", b"NOSTEM"]
+    vector = ["identifier", "vector", "attribute", "vector", "type", "VECTOR"]
+    info = {
+        "attributes": [text, vector + ["algorithm", "FLAT", "data_type", "FLOAT16"]]
+    }
+    assert vector_type(info) == "FLOAT16"
+    assert vector_type({"attributes": [text, vector]}) is None
+
+
+class FakeIndexClient:
+    """Just enough of a Redis client for warmup: FT.INFO and SET NX."""
+
+    def __init__(self) -> None:
+        self.url_type = "TEXT"
+        self.keys: dict = {}
+
+    def ft(self, name):
+        return self
+
+    async def info(self):
+        url = ["identifier", "$.url", "attribute", "url", "type", self.url_type]
+        return {"attributes": [url]}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    async def delete(self, key):
+        self.keys.pop(key, None)
+
+
+def test_only_one_worker_migrates_the_url_field():
+    client = FakeIndexClient()
+    migrations = []
+
+    async def migrate_index(index_config):
+        migrations.append(index_config)
+        await asyncio.sleep(0.05)
+        client.url_type = "TAG"
+
+    async def main():
+        workers = [RedisVectorCache(host="localhost", port=6379) for _ in range(3)]
+        for worker in workers:
+            worker.client = client  # type: ignore
+            worker.migrate_index = migrate_index  # type: ignore
+        await asyncio.gather(
+            *(worker._migrate_url_field(poll_interval=0.01) for worker in workers)
+        )
+
+    asyncio.run(main())
+    assert len(migrations) == 1
+    assert client.keys == {}
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from retrieval.embeddings import BatchingEmbeddings, CachedEmbeddings, Embeddings
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeds a text as [len(text), index of the call]; fails on "boom"."""
+
+    vector_dimension = 2
+    model = "fake"
+
+    def __init__(self, replies=None) -> None:
+        self.calls: list[list[str]] = []
+        self.replies = replies
+
+    async def run(self, chunks: list[str]) -> list[list[float]]:
+        self.calls.append(chunks)
+        if self.replies is not None:
+            return self.replies
+        if "boom" in chunks:
+            raise RuntimeError("boom")
+        return [[float(len(chunk)), float(len(self.calls))] for chunk in chunks]
+
+
+def test_batching_merges_requests_and_keeps_order():
+    async def main():
+        upstream = FakeEmbeddings()
+        batching = BatchingEmbeddings(upstream)
+        results = await asyncio.gather(
+            batching.run(["ccc", "a"]), batching.run(["a", "bb"])
+        )
+        return upstream, results
+
+    upstream, (first, second) = asyncio.run(main())
+    assert upstream.calls == [["ccc", "a", "bb"]]
+    assert first == [[3.0, 1.0], [1.0, 1.0]]
+    assert second == [[1.0, 1.0], [2.0, 1.0]]
+
+
+def test_batching_fails_only_the_request_with_the_bad_input():
+    async def main():
+        upstream = FakeEmbeddings()
+        batching = BatchingEmbeddings(upstream)
+        results = await asyncio.gather(
+            batching.run(["a"]), batching.run(["boom"]), return_exceptions=True
+        )
+        return batching, results
+
+    batching, (good, bad) = asyncio.run(main())
+    assert good == [[1.0, 2.0]]
+    assert isinstance(bad, RuntimeError)
+    assert batching.retries == 2
+
+
+def test_batching_rejects_short_replies():
+    async def main():
+        batching = BatchingEmbeddings(FakeEmbeddings(replies=[[1.0, 1.0]]))
+        return await batching.run(["a", "b"])
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+def test_batching_truncates_inputs_over_the_token_limit():
+    async def main():
+        upstream = FakeEmbeddings()
+        batching = BatchingEmbeddings(upstream, max_input_tokens=3)
+        await batching.run(["x" * 100])
+        return upstream, batching
+
+    upstream, batching = asyncio.run(main())
+    assert upstream.calls == [["x" * 8]]
+    assert batching.truncated == 1
+
+
+def test_batching_splits_by_input_count():
+    async def main():
+        upstream = FakeEmbeddings()
+        batching = BatchingEmbeddings(upstream, max_batch_inputs=2)
+        vectors = await batching.run(["a", "bb", "ccc"])
+        return upstream, vectors
+
+    upstream, vectors = asyncio.run(main())
+    assert sorted(map(len, upstream.calls)) == [1, 2]
+    assert [vector[0] for vector in vectors] == [1.0, 2.0, 3.0]
+
+
+def test_cached_embeddings_serve_repeats_from_memory():
+    async def main():
+        upstream = FakeEmbeddings()
+        cached = CachedEmbeddings(upstream)
+        first = await cached.run(["a", "bb"])
+        second = await cached.run(["bb", "a"])
+        return upstream, cached, first, second
+
+    upstream, cached, first, second = asyncio.run(main())
+    assert upstream.calls == [["a", "bb"]]
+    assert second == [first[1], first[0]]
+    assert (cached.hits, cached.misses) == (2, 2)
+
+
+def test_cached_embeddings_reject_short_replies():
+    async def main():
+        cached = CachedEmbeddings(FakeEmbeddings(replies=[[1.0, 1.0]]))
+        try:
+            await cached.run(["a", "b"])
+        finally:
+            assert not cached._lru
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+def test_cached_embeddings_never_cache_empty_vectors():
+    async def main():
+        upstream = FakeEmbeddings(replies=[[]])
+        cached = CachedEmbeddings(upstream)
+        first = await cached.run(["a"])
+        second = await cached.run(["a"])
+        return upstream, cached, first, second
+
+    upstream, cached, first, second = asyncio.run(main())
+    assert first == second == [[]]
+    assert len(upstream.calls) == 2
+    assert not cached._lru
+
+
+class DownRedis:
+    """Redis client whose every command fails."""
+
+    async def mget(self, keys):
+        raise ConnectionError("down")
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def set(self, *args, **kwargs):
+        pass
+
+    async def execute(self):
+        raise ConnectionError("down")
+
+
+def test_cached_embeddings_fall_back_when_redis_fails():
+    async def main():
+        upstream = FakeEmbeddings()
+        cached = CachedEmbeddings(upstream, redis_client=DownRedis())  # type: ignore
+        first = await cached.run(["a", "bb"])
+        second = await cached.run(["a"])
+        return upstream, cached, first, second
+
+    upstream, cached, first, second = asyncio.run(main())
+    assert first == [[1.0, 1.0], [2.0, 1.0]]
+    assert second == [first[0]]
+    assert upstream.calls == [["a", "bb"]]
+    assert cached.redis_errors == 2
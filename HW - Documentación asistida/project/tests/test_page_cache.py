@@ -0,0 +1,57 @@
+from retrieval import page_cache
+from retrieval.page_cache import PageCache
+
+
+def test_fresh_pages_are_served_then_need_revalidation(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(page_cache.time, "time", lambda: now[0])
+    cache = PageCache(fresh_for=10, ttl=100)
+    cache.store("u", "text", etag='"v1"')
+
+    page, fresh = cache.lookup("u")
+    assert fresh and page.text == "text"  # type: ignore
+
+    now[0] += 11
+    page, fresh = cache.lookup("u")
+    assert not fresh and page.etag == '"v1"'  # type: ignore
+
+    cache.revalidated("u")
+    assert cache.lookup("u")[1]
+    assert (cache.hits, cache.revalidations) == (2, 1)
+
+
+def test_pages_past_the_ttl_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(page_cache.time, "time", lambda: now[0])
+    cache = PageCache(ttl=100)
+    cache.store("u", "text")
+
+    now[0] += 101
+    assert cache.lookup("u") == (None, False)
+    assert (len(cache._pages), cache._bytes) == (0, 0)
+
+
+def test_least_recently_used_pages_are_evicted_past_max_bytes():
+    cache = PageCache(max_bytes=10)
+    cache.store("a", "aaaa")
+    cache.store("b", "bbbb")
+    cache.lookup("a")
+    cache.store("c", "cccc")
+
+    assert cache.lookup("b") == (None, False)
+    assert cache.lookup("a")[0] is not None
+    assert (cache._bytes, cache.evictions) == (8, 1)
+
+
+def test_restoring_a_page_replaces_its_size():
+    cache = PageCache()
+    cache.store("u", "short")
+    cache.store("u", "a longer text")
+    assert cache._bytes == len("a longer text")
+
+
+def test_pages_larger_than_the_cache_are_not_stored():
+    cache = PageCache(max_bytes=4)
+    cache.store("u", "too long")
+    assert cache.lookup("u") == (None, False)
+    assert cache._bytes == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from retrieval.reduction import (
+    PCAReducer,
+    RandomProjectionReducer,
+    compress,
+    load_reducer,
+)
+
+
+def sample(rows=200, dimension=32, rank=4, seed=0):
+    """Vectors that lie close to a rank-dimensional subspace."""
+
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, dimension))
+    noise = 0.01 * rng.standard_normal((rows, dimension))
+    return rng.standard_normal((rows, rank)) @ basis + noise
+
+
+def test_pca_keeps_the_similarities_of_low_rank_vectors():
+    vectors = sample()
+    reducer = PCAReducer(32, 4).fit(vectors)
+    reduced = reducer.transform(vectors[:10])
+
+    unit = vectors[:10] / np.linalg.norm(vectors[:10], axis=1, keepdims=True)
+    assert reduced.shape == (10, 4)
+    assert reduced.dtype == np.float32
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1, atol=1e-5)
+    assert np.allclose(reduced @ reduced.T, unit @ unit.T, atol=0.05)
+
+
+def test_pca_needs_enough_samples_and_a_fit():
+    with pytest.raises(ValueError):
+        PCAReducer(32, 8).fit(sample(rows=4))
+    with pytest.raises(RuntimeError):
+        PCAReducer(32, 8).transform(sample(rows=1))
+    with pytest.raises(ValueError):
+        PCAReducer(8, 32)
+
+
+@pytest.mark.parametrize(
+    "reducer",
+    [PCAReducer(32, 4).fit(sample()), RandomProjectionReducer(32, 4, seed=7)],
+)
+def test_saved_reducers_load_back_unchanged(tmp_path, reducer):
+    path = tmp_path / "reducer.npz"
+    reducer.save(str(path))
+    loaded = load_reducer(str(path))
+
+    assert type(loaded) is type(reducer)
+    assert (loaded.input_dimension, loaded.output_dimension) == (32, 4)
+    vectors = sample(rows=5, seed=1)
+    assert np.array_equal(loaded.transform(vectors), reducer.transform(vectors))
+
+
+def test_compress_reduces_and_casts():
+    vectors = sample(rows=3)
+    assert compress(vectors).dtype == np.float32
+    assert np.array_equal(compress(vectors), vectors.astype(np.float32))
+
+    reducer = RandomProjectionReducer(32, 4)
+    compressed = compress(vectors, reducer, "FLOAT16")
+    assert compressed.shape == (3, 4)
+    assert compressed.dtype == np.float16
+    assert np.allclose(compressed, reducer.transform(vectors), atol=1e-3)
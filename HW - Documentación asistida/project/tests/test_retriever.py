@@ -0,0 +1,202 @@
+import asyncio
+
+from models.document import Document
+from models.search import SearchDoc, SearchResult
+from retrieval.cache import VectorDbCache
+from retrieval.embeddings import Embeddings
+from retrieval.retriever import Retriever
+from retrieval.search import Searcher
+from retrieval.splitter import Splitter
+
+
+class FakeCache(VectorDbCache):
+    def __init__(self, documents=()) -> None:
+        self.documents = list(documents)
+        self.written: list[Document] = []
+        self._listeners = []
+
+    async def find_similar(self, vector, k=10, with_vectors=False, urls=None):
+        found = [doc for doc in self.documents if urls is None or doc.url in urls]
+        return sorted(found, key=lambda doc: doc.similarity, reverse=True)[:k]
+
+    async def cached_urls(self, urls):
+        return {doc.url for doc in self.documents} & set(urls)
+
+    async def write(self, documents):
+        self.written.extend(documents)
+
+
+class FakeSearcher(Searcher):
+    def __init__(self, links) -> None:
+        self.links = links
+
+    async def run(self, query: str) -> SearchResult:
+        return SearchResult(items=[SearchDoc(link=link) for link in self.links])
+
+
+class FakeScraper:
+    """Pages are "|"-separated chunks; a page given as an exception fails."""
+
+    def __init__(self, pages, delays=None) -> None:
+        self.pages = pages
+        self.delays = delays or {}
+        self.fetched: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def fetch(self, link):
+        self.fetched.append(link)
+        try:
+            await asyncio.sleep(self.delays.get(link, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(link)
+            raise
+        page = self.pages[link]
+        if isinstance(page, Exception):
+            raise page
+        return {"url": link, "text": page}
+
+
+class FakeSplitter(Splitter):
+    async def split(self, text: str) -> list[str]:
+        return text.split("|")
+
+
+class FakeEmbeddings(Embeddings):
+    """Chunks named "good..." point along the query vector, the others across it."""
+
+    vector_dimension = 2
+    model = "fake"
+
+    async def run(self, chunks: list[str]) -> list[list[float]]:
+        return [
+            [1.0, 0.0] if chunk.startswith("good") else [0.0, 1.0] for chunk in chunks
+        ]
+
+
+def document(text, url, similarity):
+    return Document(text=text, url=url, vector=[], similarity=similarity)
+
+
+def retriever(cache, links, scraper, **kwargs) -> Retriever:
+    return Retriever(
+        cache=cache,
+        searcher=FakeSearcher(links),
+        scraper=scraper,  # type: ignore
+        embeddings=FakeEmbeddings(),
+        splitter=FakeSplitter(),
+        **kwargs,
+    )
+
+
+def context_of(retriever: Retriever, k: int) -> str:
+    async def main():
+        events = [
+            event
+            async for event in retriever.get_context(
+                "query", cache_treshold=0.85, k=k, query_vector=[1.0, 0.0]
+            )
+        ]
+        return events[-1]["data"]
+
+    return asyncio.run(main())
+
+
+def test_partial_hit_loads_the_chunks_of_cached_result_pages():
+    cache = FakeCache(
+        [
+            document("kept", "a", 0.9),
+            document("elsewhere", "x", 0.5),
+            document("cached page", "b", 0.3),
+        ]
+    )
+    scraper = FakeScraper({"d": "good new page"})
+    search = retriever(cache, ["b", "d"], scraper, partial_hit_threshold=0.8)
+
+    assert context_of(search, k=2) == "kept\ncached page"
+    assert scraper.fetched == []
+
+
+def search(retriever: Retriever, scraper: FakeScraper, links, k=5):
+    """Runs search_for_documents and reports the fetches cancelled by then."""
+
+    async def main():
+        documents = await retriever.search_for_documents(
+            SearchResult(items=[SearchDoc(link=link) for link in links]),
+            [1.0, 0.0],
+            k,
+        )
+        await asyncio.sleep(0)
+        return documents, list(scraper.cancelled)
+
+    return asyncio.run(main())
+
+
+def test_search_stops_at_the_deadline():
+    scraper = FakeScraper({"fast": "good a|bad a", "slow": "good b"}, {"slow": 5})
+    documents, cancelled = search(
+        retriever(FakeCache(), [], scraper, deadline=0.1), scraper, ["fast", "slow"]
+    )
+
+    assert {doc.text for doc in documents} == {"good a", "bad a"}
+    assert cancelled == ["slow"]
+
+
+def test_search_stops_early_on_enough_good_chunks():
+    scraper = FakeScraper({"fast": "good a|good b|bad", "slow": "good c"}, {"slow": 5})
+    search_retriever = retriever(
+        FakeCache(), [], scraper, good_chunk_threshold=0.8, min_good_chunks=2
+    )
+    documents, cancelled = search(search_retriever, scraper, ["fast", "slow"], k=2)
+
+    assert [doc.text for doc in documents] == ["good a", "good b"]
+    assert cancelled == ["slow"]
+
+
+def test_search_waits_for_every_page_without_a_stop_condition():
+    scraper = FakeScraper({"a": "good a", "b": "bad b"}, {"b": 0.05})
+    documents, cancelled = search(
+        retriever(FakeCache(), [], scraper), scraper, ["a", "b"]
+    )
+
+    assert {doc.text for doc in documents} == {"good a", "bad b"}
+    assert cancelled == []
+
+
+def test_failed_fetches_are_skipped():
+    scraper = FakeScraper({"broken": RuntimeError("boom"), "ok": "good a"})
+    documents, _ = search(
+        retriever(FakeCache(), [], scraper), scraper, ["broken", "ok"]
+    )
+
+    assert [doc.text for doc in documents] == ["good a"]
+    assert sorted(scraper.fetched) == ["broken", "ok"]
+
+
+def top_up(retriever: Retriever, links, kept, cached_urls, k):
+    return asyncio.run(
+        retriever.top_up(
+            SearchResult(items=[SearchDoc(link=link) for link in links]),
+            [1.0, 0.0],
+            kept,
+            cached_urls,
+            k,
+        )
+    )
+
+
+def test_top_up_fetches_one_uncached_page_per_missing_chunk():
+    pages = {link: f"good {link}" for link in "abcd"}
+    scraper = FakeScraper(pages)
+    kept = [document("kept", "x", 0.9)]
+    documents = top_up(retriever(FakeCache(), [], scraper), "abcd", kept, {"a"}, k=3)
+
+    assert sorted(scraper.fetched) == ["b", "c"]
+    assert sorted(doc.text for doc in documents) == ["good b", "good c"]
+
+
+def test_top_up_fetches_nothing_when_the_kept_chunks_suffice():
+    scraper = FakeScraper({"a": "good a"})
+    kept = [document("kept", "x", 0.9), document("also kept", "y", 0.85)]
+
+    assert top_up(retriever(FakeCache(), [], scraper), ["a"], kept, set(), k=2) == []
+    assert scraper.fetched == []
@@ -0,0 +1,47 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("playwright")
+
+# The scraper service is its own app; its main module is loaded by path so it
+# does not clash with the orchestrator's.
+spec = importlib.util.spec_from_file_location(
+    "scraper_main", Path(__file__).parent.parent / "src" / "scraper" / "main.py"
+)
+scraper = importlib.util.module_from_spec(spec)  # type: ignore
+spec.loader.exec_module(scraper)  # type: ignore
+
+ARTICLE = "<p>" + "Plain server-rendered article text. " * 20 + "</p>"
+
+
+def page(body: str, head: str = "") -> str:
+    return f"<html><head>{head}</head><body>{body}</body></html>"
+
+
+def test_empty_pages_need_javascript():
+    assert scraper.needs_javascript(None)
+    assert scraper.needs_javascript("  \n ")
+
+
+def test_server_rendered_pages_do_not():
+    assert not scraper.needs_javascript(page(ARTICLE))
+
+
+def test_app_shells_need_javascript():
+    bundle = "<script>" + "var x = 1;" * 500 + "</script>"
+    assert scraper.needs_javascript(page('<div id="root"></div>', head=bundle))
+
+
+def test_text_drowned_in_markup_needs_javascript():
+    markup = '<div class="wrapper">' * 2000 + ARTICLE + "</div>" * 2000
+    assert scraper.needs_javascript(page(markup))
+
+
+def test_enable_javascript_notices_count_on_short_pages_only():
+    notice = "<noscript>Please enable JavaScript to continue.</noscript>"
+    assert scraper.needs_javascript(page(notice + ARTICLE))
+
+    long_article = ARTICLE * 5
+    assert not scraper.needs_javascript(page(notice + long_article))
@@ -0,0 +1,91 @@
+import asyncio
+
+from models.search import SearchResult
+from retrieval.search import PROVISIONAL_RESULT, CachedSearcher, Searcher
+
+
+class FakeSearcher(Searcher):
+    def __init__(self, reply=None) -> None:
+        self.queries: list[str] = []
+        self.reply = reply
+
+    async def run(self, query: str) -> SearchResult:
+        self.queries.append(query)
+        await asyncio.sleep(0.01)
+        if self.reply is not None:
+            return self.reply
+        return SearchResult(items=[{"link": f"https://example.com/{query}"}])
+
+
+def test_normalized_queries_share_an_entry():
+    async def main():
+        upstream = FakeSearcher()
+        cached = CachedSearcher(upstream)
+        first = await cached.run("Hello  World")
+        second = await cached.run(" hello world ")
+        return upstream, cached, first, second
+
+    upstream, cached, first, second = asyncio.run(main())
+    assert upstream.queries == ["Hello  World"]
+    assert second is first
+    assert (cached.hits, cached.misses) == (1, 1)
+
+
+def test_concurrent_searches_are_coalesced():
+    async def main():
+        upstream = FakeSearcher()
+        cached = CachedSearcher(upstream)
+        results = await asyncio.gather(*(cached.run("query") for _ in range(5)))
+        return upstream, cached, results
+
+    upstream, cached, results = asyncio.run(main())
+    assert len(upstream.queries) == 1
+    assert all(result is results[0] for result in results)
+    assert (cached.misses, cached.coalesced) == (1, 4)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        cached = CachedSearcher(FakeSearcher())
+        first = asyncio.create_task(cached.run("query"))
+        second = asyncio.create_task(cached.run("query"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()).items[0].link == "https://example.com/query"
+
+
+def test_entries_expire_after_the_ttl():
+    async def main():
+        upstream = FakeSearcher()
+        cached = CachedSearcher(upstream, ttl=0.05)
+        await cached.run("query")
+        await cached.run("query")
+        await asyncio.sleep(0.06)
+        await cached.run("query")
+        return upstream
+
+    assert len(asyncio.run(main()).queries) == 2
+
+
+def test_provisional_results_are_not_cached():
+    async def main():
+        upstream = FakeSearcher(reply=PROVISIONAL_RESULT)
+        cached = CachedSearcher(upstream)
+        await cached.run("query")
+        await cached.run("query")
+        return upstream
+
+    assert len(asyncio.run(main()).queries) == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    async def main():
+        upstream = FakeSearcher()
+        cached = CachedSearcher(upstream, max_entries=2)
+        for query in ("a", "b", "a", "c", "b"):
+            await cached.run(query)
+        return upstream
+
+    assert asyncio.run(main()).queries == ["a", "b", "c", "b"]
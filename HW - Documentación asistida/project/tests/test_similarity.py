@@ -0,0 +1,38 @@
+import numpy as np
+
+from retrieval.similarity import cosine_scores, normalize, to_matrix, top_k
+
+
+def test_normalize_leaves_zero_rows_alone():
+    matrix = normalize(to_matrix([[3.0, 4.0], [0.0, 0.0]]))
+    assert np.allclose(matrix, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_cosine_scores_against_normalized_rows():
+    matrix = normalize(to_matrix([[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]]))
+    scores = cosine_scores([2.0, 0.0], matrix)
+    assert np.allclose(scores, [1.0, 0.0, np.sqrt(0.5)])
+
+
+def test_top_k_is_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_k(scores, 2).tolist() == [1, 3]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k(scores, 0).tolist() == []
+
+
+def test_top_k_ties_keep_input_order():
+    scores = np.array([0.5, 0.9, 0.5, 0.5])
+    assert top_k(scores, 3).tolist() == [1, 0, 2]
+
+
+def test_top_k_ties_at_the_cut_keep_input_order():
+    scores = np.full(1001, 0.5)
+    scores[999] = 0.9
+    assert top_k(scores, 3).tolist() == [999, 0, 1]
+
+
+def test_top_k_matches_a_stable_sort():
+    scores = np.round(np.random.default_rng(0).random(500), 1)
+    expected = np.argsort(-scores, kind="stable")[:10]
+    assert top_k(scores, 10).tolist() == expected.tolist()
@@ -0,0 +1,13 @@
+from retrieval.similarity import normalize, to_matrix
+from retrieval.splitter import AdjSenSplitter
+
+
+def test_segments_of_adjacent_similar_sentences():
+    sents = ["aaaa", "bb", "cccccc", "d"]
+    # The first two sentences are alike, then every sentence starts a cluster.
+    vecs = normalize(to_matrix([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [-1.0, 0.0]]))
+    starts, ends, joined = AdjSenSplitter(workers=0)._segments(sents, vecs, 0.5)
+
+    assert starts == [0, 2, 3]
+    assert ends == [2, 3, 4]
+    assert joined == [len("aaaa bb"), len("cccccc"), len("d")]